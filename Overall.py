@@ -1,5 +1,4 @@
 import streamlit as st
-from streamlit_extras.switch_page_button import switch_page
 import pandas as pd
 import plotly.express as px
 from plotly.subplots import make_subplots
@@ -7,118 +6,65 @@ import matplotlib.pyplot as plt
 import plotly.graph_objects as go
 import numpy as np
 from bokeh.models.widgets import Div
-from google.cloud import firestore
-from google.oauth2 import service_account
-import json
+from data.aggregates import responses, mean
+from data.figure_cache import cached_figure
+from data.handle import DATASET
+from data.host import HostedData
+from data.listeners import FirestoreListeners, LIVE_UPDATES
+from data.refresher import DataRefresher
+from data.sources import FirestoreSource, configured_source, firestore_database
+from data.timing import timed, plotly_chart
+from data.trends import FREQUENCIES
 
 @st.cache_resource # Caches the connection to the database
 def get_database(key_data):
-    creds = service_account.Credentials.from_service_account_info(key_data)
-    db = firestore.Client(credentials=creds)
-    return db
-
-@st.cache_data(ttl = 1800) # Caches the updates and forces an update every 30 minutes
-def get_data(_db):
-    # Create a reference to the Google post.
-    doc_ref = _db.collection('master_data')
-
-    # Create dictionary that will be used to create dataframe
-    data_dict = { "Form Name": [], "Timestamp": [], "Course Rating": [], 
-    "Guidelines Before": [], "Guidelines After": [], "Improvement Efforts": [], 
-    "Sharing Interest": [], "Instructor Rating": [], "Accessibility Rating": [], 
-    "Navigation Rating": [], "Current Profession": [], "Student Count": [], "Student Location": []}
-
-    # Iterate through every document in the collection and append each value to the dictionary
-    for doc in doc_ref.stream():
-        data = doc.to_dict()
-        data_dict["Form Name"].append(data["form_name"])
-        data_dict["Timestamp"].append(data["timestamp"])
-        data_dict["Course Rating"].append(data["course_rating"])
-        data_dict["Guidelines Before"].append(data["guidelines_before"])
-        data_dict["Guidelines After"].append(data["guidelines_after"])
-        data_dict["Improvement Efforts"].append(data["improvement_efforts"])
-        data_dict["Sharing Interest"].append(data["sharing_interest"])
-        data_dict["Instructor Rating"].append(data["instructor_rating"])
-        data_dict["Accessibility Rating"].append(data["accessibility_rating"])
-        data_dict["Navigation Rating"].append(data["navigation_rating"])
-        data_dict["Current Profession"].append(data["current_profession"])
-        data_dict["Student Count"].append(data["student_count"])
-        data_dict["Student Location"].append(data["student_location"])
-
-    # for i in data_dict:
-    #     print(i)
-    #     print(len(data_dict[i]))
-
-    return pd.DataFrame(data_dict)
-
-@st.cache_data(ttl = 1800) # Caches the updates and forces an update every 30 minutes
-def get_feedback_data(_db):
-    collections = [c.id for c in _db.collections()]
-
-    collections.remove("master_data")
-    feedback_dic = {}
-
-    # Iterate through each collection and obtain the feedback documents into a dataframe style dictionary
-
-    for collection in collections:
-        collection_ref = _db.collection(collection)
-
-        # Checks if the collection is empty
-
-        try:
-            doc_ref = collection_ref.document("row0")
-        except:
-            print("No document in collection", collection)
-
-    # Gets all the keys in the document
-
-        all_keys = doc_ref.get().to_dict().keys()
-
-    # Gets all the keys that contain the word "feedback" and removes the None values
-
-        feedback_keys = [key if "feedback" in key else None for key in all_keys]
-        feedback_keys = [key for key in feedback_keys if key is not None]
-
-        # Creates a dictionary of arrays with the feedback keys as the keys and the feedback as the values
-
-        feedback_documents = {}
-        for document in collection_ref.stream():
-            for key in feedback_keys:
-                if key in feedback_documents:
-                    feedback_documents[key].append(document.to_dict()[key])
-                else:
-                    feedback_documents[key] = [document.to_dict()[key]]
-
-        # Adds the dictionary to the feedback dictionary
-        feedback_dic[collection.lower().replace(" ", "_", 1000)] = feedback_documents
-    
-    return feedback_dic
+    return firestore_database(key_data)
+
+@st.cache_resource # Picks the data source once per server process
+def get_data_source():
+    # Configured with a [data_source] table in secrets.toml, e.g. type = "csv" and path = "data/data.csv"
+    return configured_source(st.secrets, get_database)
+
+@st.cache_resource # Starts one background refresher per server process, requests only ever read its current dataset
+def get_refresher(_source):
+    # Every page reads the dataset through the process-wide handle
+    if isinstance(_source, HostedData):
+        return DATASET.attach(_source.start())
+    refresher = DataRefresher(_source).start()
+
+    # Pushes new Firestore submissions into the dataset as they arrive
+    if isinstance(_source, FirestoreSource) and LIVE_UPDATES:
+        refresher.listeners = FirestoreListeners(_source.db, refresher.apply_delta).start()
+    return DATASET.attach(refresher)
 
 # Set page title and favicon
 st.set_page_config(page_title="Homepage", page_icon="assets/EENC-logo.png", layout="wide")
 
-# Authenticate to Firestore with the JSON account key.
-key_dict = json.loads(st.secrets['textkey'])
-st.session_state["database_connection"] = get_database(key_dict)
+page_timer = timed("Overall: page").start()
+
+# Firestore, or a local CSV, Parquet or snapshot file when configured
+source = get_data_source()
 
-# Sets the master data state
-st.session_state["master_data"] = get_data(st.session_state["database_connection"])
+refresher = get_refresher(source)
 
-# Sets the feedback data state
-st.session_state["feedback_data"] = get_feedback_data(st.session_state["database_connection"])
+# Rebuilds the master data from scratch in the background instead of only pulling new responses
+if st.sidebar.button("Reload all data"):
+    refresher.trigger(full=True)
+
+# Served from the last completed refresh, never waits on the data source. The
+# session only keeps its filters and the dataset version, not the data.
+dataset = DATASET.current(st.session_state)
 
 # Sets the dropdown state
 if "formname" not in st.session_state:
     st.session_state["formname"] = "All"
 
 # Load the data
-# Data from Streamlit state
-data = st.session_state["master_data"]
-feedback = st.session_state["feedback_data"]
-
+data = dataset.master
+aggregates = dataset.aggregates
+partitions = dataset.partitions
+trends = dataset.trends
 
-# replace 'N/A' with NaN
-data = data.replace('N/A', float('nan'))
 
 # logo
 st.image("assets/EENC-logo.png", width=100)
@@ -129,10 +75,8 @@ text_color = "#6D7183"
 
 # Sidebar
 st.sidebar.title("Filters")
-unique_form_names = sorted(data['Form Name'].unique())
-cleaned_form_names = [name.replace('_', ' ').title() for name in unique_form_names]
-
-options = ["All"] + cleaned_form_names
+# Sidebar options, precomputed once per data version
+options = partitions.options
 
 form_name = st.sidebar.selectbox("Select Form Name", options, options.index(st.session_state["formname"]))
 
@@ -140,19 +84,25 @@ st.title("Welcome to the EENC dashboard")
 st.markdown("This page displays overall information for the EENC courses. Use the filter on the left to customize the results.")
 st.markdown('---')
 
+# Reports on the background refresher
+if refresher.last_refreshed is not None:
+    st.sidebar.caption(f"Data refreshed {refresher.last_refreshed:%Y-%m-%d %H:%M} UTC in {refresher.last_duration:.1f}s")
+if refresher.refreshing():
+    st.sidebar.caption("Refreshing data in the background")
+if refresher.last_error is not None:
+    st.sidebar.warning(f"Last data refresh failed, showing the previous data. {refresher.last_error}")
+
 st.sidebar.caption("Need more help? Refer to our documentation [here](https://docs.google.com/document/d/19GpSxMp12O3dHoJHs6DARf3IpwtUShdqWRiDNICFZXI/edit?usp=sharing)")
 
 if form_name != 'All':
-    formatted_form_name = f"{form_name.lower().replace(' ', '_')}"
-    data = data[data['Form Name'] == formatted_form_name]
+    formatted_form_name = partitions.key(form_name)
     st.session_state["formname"] = form_name
 else:
+    formatted_form_name = "All"
     st.session_state["formname"] = "All"
 
-
-# Check that this translates over guidelines qualitative values to quantitative
-guidelines_before = data['Guidelines Before']
-guidelines_after = data['Guidelines After']
+# Precomputed counts and sums for the selected form
+view = aggregates.view(formatted_form_name)
 
 c1, c2 = st.columns((7,3))
 with c1:
@@ -160,12 +110,12 @@ with c1:
 with c2:
     guidelines_button = st.button("More details about demographics")
     if guidelines_button:
-        switch_page("Demographics")
+        st.switch_page("pages/Demographics.py")
 
 col2, col3, col4 = st.columns(3)
 
-col2.metric("No. of People Reached", str(len(data)))
-profession_count = data['Current Profession'].value_counts()
+col2.metric("No. of People Reached", str(responses(view)))
+profession_count = aggregates.profession_counts(formatted_form_name)
 max_attendees = profession_count.max()
 highest_attendees_profession = profession_count[profession_count == max_attendees].index.tolist()
 if not highest_attendees_profession:
@@ -182,29 +132,29 @@ with c1:
 with c2:
     guidelines_button = st.button("More details about guidelines")
     if guidelines_button:
-        switch_page("Guidelines")
+        st.switch_page("pages/Guidelines.py")
 
 col2, col3, col4 = st.columns(3)
-improvement_efforts_mean = data['Improvement Efforts'].mean()
-guidelines_before_mean = guidelines_before.mean()
-guidelines_after_mean = guidelines_after.mean()
+improvement_efforts_mean = mean(view, 'Improvement Efforts')
+guidelines_before_mean = mean(view, 'Guidelines Before')
+guidelines_after_mean = mean(view, 'Guidelines After')
 num_cols = 0
-if not np.isnan(improvement_efforts_mean):
+if not pd.isna(improvement_efforts_mean):
     num_cols += 1
-if not np.isnan(guidelines_before_mean):
+if not pd.isna(guidelines_before_mean):
     num_cols += 1
-if not np.isnan(guidelines_after_mean):
+if not pd.isna(guidelines_after_mean):
     num_cols += 1
 if num_cols > 0:
     cols = st.columns(num_cols)
     col_idx = 0
-    if not np.isnan(improvement_efforts_mean):
+    if not pd.isna(improvement_efforts_mean):
         cols[col_idx].metric("Avg. Improvement Efforts", round(improvement_efforts_mean, 2))
         col_idx += 1
-    if not np.isnan(guidelines_before_mean):
+    if not pd.isna(guidelines_before_mean):
         cols[col_idx].metric("Avg. Guidelines Before", round(guidelines_before_mean, 2))
         col_idx += 1
-    if not np.isnan(guidelines_after_mean):
+    if not pd.isna(guidelines_after_mean):
         cols[col_idx].metric("Avg. Guidelines After", round(guidelines_after_mean, 2))
         col_idx += 1
 else:
@@ -222,40 +172,37 @@ with c1:
 with c2:
     ratings_button = st.button("More details about ratings")
     if ratings_button:
-        switch_page("ratings")
+        st.switch_page("pages/Ratings.py")
 
 
-course_rating_mean = data['Course Rating'].mean()
-instructor_rating_mean = data['Instructor Rating'].mean()
-try:
-    accessibility_rating_mean = data['Accessibility Rating'].mean()
-except:
-    print(data["Accessibility Rating"])
-navigation_rating_mean = data['Navigation Rating'].mean()
+course_rating_mean = mean(view, 'Course Rating')
+instructor_rating_mean = mean(view, 'Instructor Rating')
+accessibility_rating_mean = mean(view, 'Accessibility Rating')
+navigation_rating_mean = mean(view, 'Navigation Rating')
 
 num_cols = 0
-if not np.isnan(course_rating_mean):
+if not pd.isna(course_rating_mean):
     num_cols += 1
-if not np.isnan(instructor_rating_mean):
+if not pd.isna(instructor_rating_mean):
     num_cols += 1
-if not np.isnan(accessibility_rating_mean):
+if not pd.isna(accessibility_rating_mean):
     num_cols += 1
-if not np.isnan(navigation_rating_mean):
+if not pd.isna(navigation_rating_mean):
     num_cols += 1
 
 if num_cols > 0:
     cols = st.columns(num_cols)
     col_idx = 0
-    if not np.isnan(course_rating_mean):
+    if not pd.isna(course_rating_mean):
         cols[col_idx].metric("Avg. Course", round(course_rating_mean, 2))
         col_idx += 1
-    if not np.isnan(instructor_rating_mean):
+    if not pd.isna(instructor_rating_mean):
         cols[col_idx].metric("Avg. Instructor", round(instructor_rating_mean, 2))
         col_idx += 1
-    if not np.isnan(accessibility_rating_mean):
+    if not pd.isna(accessibility_rating_mean):
         cols[col_idx].metric("Avg. Accessibility", round(accessibility_rating_mean, 2))
         col_idx += 1
-    if not np.isnan(navigation_rating_mean):
+    if not pd.isna(navigation_rating_mean):
         cols[col_idx].metric("Avg. Navigation", round(navigation_rating_mean, 2))
 else:
     st.write("No ratings available.")
@@ -268,6 +215,47 @@ st.info("All average ratings are calculated out of 5.")
 
 st.markdown('   ')
 
+st.header("Trends")
+
+# Dates of the first and last response of the selected form
+date_range = trends.date_range(formatted_form_name)
+if date_range is None:
+    st.write("No dated responses available.")
+else:
+    col1, col2 = st.columns(2)
+    trend_frequency = col1.radio("Group by", list(FREQUENCIES), index=2, horizontal=True)
+    picked_dates = col2.date_input("Dates", value=date_range, min_value=date_range[0], max_value=date_range[1])
+    start_date, end_date = picked_dates if len(picked_dates) == 2 else (picked_dates[0], date_range[1])
+
+    def load_trend():
+        # Read from the pre-bucketed rollups, the whole range uses the stored periods
+        if (start_date, end_date) == date_range:
+            return trends.series(trend_frequency, formatted_form_name)
+        return trends.series(trend_frequency, formatted_form_name, start_date, end_date)
+
+    trend_filters = [formatted_form_name, trend_frequency, start_date, end_date]
+
+    def build_responses_trend_fig():
+        trend = load_trend()
+        fig = px.line(x=trend.index, y=trend["Responses"], markers=True, labels=dict(x='Date', y='Number of Responses'), color_discrete_sequence=[secondary_color])
+        return fig
+
+    def build_ratings_trend_fig():
+        rating_columns = ['Course Rating', 'Instructor Rating', 'Accessibility Rating', 'Navigation Rating']
+        fig = px.line(load_trend(), y=rating_columns, markers=True, labels=dict(Period='Date', value='Average Rating', variable='Rating'))
+        fig.update_traces(connectgaps=True)
+        fig.update_yaxes(range=[0, 5.2])
+        return fig
+
+    data_version = data.attrs["version"]
+    col1, col2 = st.columns(2)
+    col1.subheader("Responses")
+    plotly_chart(col1, cached_figure(data_version, 'Overall', 'responses_trend', trend_filters, build_responses_trend_fig), 'Overall: draw responses_trend', use_container_width=True)
+    col2.subheader("Average ratings")
+    plotly_chart(col2, cached_figure(data_version, 'Overall', 'ratings_trend', trend_filters, build_ratings_trend_fig), 'Overall: draw ratings_trend', use_container_width=True)
+
+st.markdown('   ')
+
 # st.header("\nGraphs & Trends")
 # # Average knowledge gain, most popular classes, trends over time
 
@@ -355,6 +343,10 @@ st.markdown(f"""
         h1, h2, h3, h4, h5, h6 {{
             color: {primary_color};
         }}
+        /* The diagnostics page is only reached by its URL, /perf */
+        [data-testid="stSidebarNav"] li:has(a[href$="/perf"]) {{
+            display: none;
+        }}
         button {{
             float: right;
         }}
@@ -372,3 +364,5 @@ hide_default_format = """
        </style>
        """
 st.markdown(hide_default_format, unsafe_allow_html=True)
+
+page_timer.stop()
@@ -0,0 +1,276 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import generate_responses, to_documents, to_export, to_feedback
+from data.aggregates import ALL, AggregateCube, distribution, mean, rating_statistics, responses
+from data.feedback_index import FeedbackIndex
+from data.figure_cache import FIGURES
+from data.guidelines import gains, transition_matrix
+from data.handle import DATASET
+from data.locations import LOCATIONS
+from data.master_data import documents_to_frame
+from data.partitions import FormPartitions
+from data.refresher import Dataset
+from data.schema import RATING_COLUMNS, GUIDELINE_COLUMNS
+from data.search import SearchIndex
+from data.text_analytics import TextAnalytics
+from data.sources import CsvSource
+from data.trends import FREQUENCIES, TrendRollups
+
+# Times ingestion, filtering, the aggregates behind every page and the pages themselves
+# on synthetic data of several sizes, and writes a JSON report that later runs can be compared to:
+#   python -m benchmarks.run --sizes 10000 100000 1000000 --output report.json
+#   python -m benchmarks.run --output new.json --compare report.json
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+PAGES = ["Demographics", "Feedback", "Guidelines", "Ratings"]
+
+def measure(function, repeat):
+    # Wall clock seconds of every run, the result of the last one is returned too
+    times = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - started)
+    return times, result
+
+def summarize(name, size, times, **extra):
+    return {
+        "name": name,
+        "size": size,
+        "runs": len(times),
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "rows_per_second": size / statistics.median(times) if statistics.median(times) > 0 else None,
+        **extra,
+    }
+
+def filter_rows(frame):
+    # The boolean filtering every page used to do on each rerun
+    for form in frame["Form Name"].dropna().unique():
+        form_rows = frame[frame["Form Name"] == form]
+        for location in LOCATIONS:
+            form_rows[form_rows["Student Location"] == location]
+
+def filter_partitions(partitions):
+    for key in partitions.partitions:
+        partitions.frame(key)
+
+def filter_views(cube):
+    for form in [ALL] + cube.forms():
+        for location in [ALL] + LOCATIONS:
+            cube.view(form, location)
+
+def compute_overall(cube, form):
+    view = cube.view(form)
+    responses(view)
+    cube.profession_counts(form)
+    for column in RATING_COLUMNS + GUIDELINE_COLUMNS:
+        mean(view, column)
+
+def compute_demographics(cube, form):
+    cube.profession_totals(form)
+    cube.student_count_summary(form)
+    cube.location_table(form)
+    for column in RATING_COLUMNS:
+        cube.location_ratings(form, column)
+
+def compute_guidelines(cube, form):
+    for location in [ALL] + cube.location_options(form):
+        view = cube.view(form, location)
+        distribution(view, "Guidelines Before")
+        distribution(view, "Guidelines After")
+        gains(transition_matrix(view))
+
+def compute_trends(trends, form):
+    for frequency in FREQUENCIES:
+        trends.series(frequency, form)
+    start, end = trends.date_range(form)
+    trends.series("Week", form, start + (end - start) / 4, end - (end - start) / 4)
+
+def search_feedback(search, form):
+    # A common word, a rare phrase and one limited to a feedback type, with the first page of each
+    for query, feedback_type in [("great", None), ('"too long" videos', None), ("confusing", "general_feedback")]:
+        search.search(query, form, feedback_type).page(0, 50)
+
+def compute_ratings(cube, form):
+    rating_statistics(cube.view(form))
+
+COMPUTE = {
+    "overall": compute_overall,
+    "demographics": compute_demographics,
+    "guidelines": compute_guidelines,
+    "ratings": compute_ratings,
+}
+
+def page_runner():
+    # The pages are scripts, so they are timed by running them headless like a session would
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        return None
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def run(page, state):
+        test = AppTest.from_file(os.path.join(root, "pages", page + ".py"), default_timeout=600)
+        for key, value in state.items():
+            test.session_state[key] = value
+        test.run()
+        if test.exception:
+            raise RuntimeError(test.exception[0].message)
+    return run
+
+def benchmark_size(size, repeat, seed, pages):
+    results = []
+    print(f"{size} responses", file=sys.stderr)
+
+    generated, raw = measure(lambda: generate_responses(size, seed), 1)
+    results.append(summarize("generate", size, generated))
+
+    documents = to_documents(raw)
+    times, frame = measure(lambda: documents_to_frame(documents), repeat)
+    results.append(summarize("ingest_documents", size, times, memory_bytes=int(frame.memory_usage(deep=True).sum())))
+    del documents
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "export.csv")
+        to_export(raw).to_csv(path, index=False)
+        times, _ = measure(lambda: CsvSource(path).load_master(), repeat)
+        results.append(summarize("ingest_csv", size, times, file_bytes=os.path.getsize(path)))
+
+    frame.attrs["version"] = f"benchmark-{size}-{seed}"
+    feedback = to_feedback(raw)
+    del raw
+
+    times, feedback_index = measure(lambda: FeedbackIndex(feedback), repeat)
+    results.append(summarize("feedback_index", size, times))
+    times, search = measure(lambda: SearchIndex(feedback), repeat)
+    results.append(summarize("search_index", size, times))
+    times, analytics = measure(lambda: TextAnalytics(feedback), repeat)
+    results.append(summarize("text_analytics", size, times))
+    times, _ = measure(lambda: analytics.updated(feedback), repeat)
+    results.append(summarize("text_analytics_unchanged", size, times))
+    times, cube = measure(lambda: AggregateCube(frame), repeat)
+    results.append(summarize("aggregates", size, times))
+    times, trends = measure(lambda: TrendRollups(frame), repeat)
+    results.append(summarize("trends", size, times))
+
+    times, _ = measure(lambda: filter_rows(frame), repeat)
+    results.append(summarize("filter_rows", size, times))
+    times, partitions = measure(lambda: FormPartitions(frame), repeat)
+    results.append(summarize("partitions", size, times))
+    times, _ = measure(lambda: filter_partitions(partitions), repeat)
+    results.append(summarize("filter_partitions", size, times))
+    times, _ = measure(lambda: filter_views(cube), repeat)
+    results.append(summarize("filter_views", size, times))
+
+    form = cube.forms()[0]
+    for name, compute in COMPUTE.items():
+        for selected in [ALL, form]:
+            times, _ = measure(lambda: compute(cube, selected), repeat)
+            results.append(summarize(f"compute_{name}", size, times, form=selected))
+    for selected in [ALL, form]:
+        times, _ = measure(lambda: compute_trends(trends, selected), repeat)
+        results.append(summarize("compute_trends", size, times, form=selected))
+    for selected in [ALL, form]:
+        times, _ = measure(lambda: search_feedback(search, selected), repeat)
+        results.append(summarize("search_feedback", size, times, form=selected))
+
+    run = page_runner() if pages else None
+    if run is not None:
+        # Pages read the dataset through the process-wide handle, sessions only hold their filters
+        dataset = Dataset(frame, partitions, cube, trends, feedback, feedback_index, search, analytics, frame.attrs["version"], datetime.datetime.now(datetime.timezone.utc))
+        DATASET.attach(types.SimpleNamespace(dataset=dataset))
+        state = {"formname": "All"}
+        for page in PAGES:
+            # Cold builds every figure, warm is served from the figure cache
+            for cache in ["cold", "warm"]:
+                times = []
+                try:
+                    for _ in range(repeat):
+                        if cache == "cold":
+                            FIGURES.clear()
+                        started = time.perf_counter()
+                        run(page, state)
+                        times.append(time.perf_counter() - started)
+                except Exception as error:
+                    results.append({"name": f"page_{page.lower()}_{cache}", "size": size, "error": str(error)})
+                    break
+                results.append(summarize(f"page_{page.lower()}_{cache}", size, times))
+
+    return results
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+    }
+
+def compare(report, previous):
+    # Ratio of the median times, below 1 is faster than the previous report
+    before = {(result["name"], result["size"], result.get("form")): result for result in previous["results"]}
+    print(f"{'benchmark':<28}{'size':>10}{'before':>12}{'after':>12}{'ratio':>8}")
+    for result in report["results"]:
+        key = (result["name"], result["size"], result.get("form"))
+        if "median" not in result or "median" not in before.get(key, {}):
+            continue
+        old = before[key]["median"]
+        name = result["name"] if result.get("form") is None else f"{result['name']} ({result['form']})"
+        print(f"{name[:27]:<28}{result['size']:>10}{old:>12.4f}{result['median']:>12.4f}{result['median'] / old if old > 0 else float('nan'):>8.2f}")
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the dashboard on synthetic survey responses")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="numbers of responses to generate")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of every benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-pages", dest="pages", action="store_false", help="skip running the pages")
+    parser.add_argument("--output", help="where to write the JSON report, printed when left out")
+    parser.add_argument("--compare", help="an earlier report to compare against")
+    options = parser.parse_args(arguments)
+
+    report = {
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "environment": environment(),
+        "options": {"sizes": options.sizes, "repeat": options.repeat, "seed": options.seed},
+        "results": [],
+    }
+    for size in options.sizes:
+        report["results"].extend(benchmark_size(size, options.repeat, options.seed, options.pages))
+
+    # Peak resident memory of the whole run, kilobytes on Linux
+    report["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if options.output:
+        with open(options.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if options.compare:
+        with open(options.compare) as file:
+            compare(report, json.load(file))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import datetime
+import numpy as np
+import pandas as pd
+from data.feedback_data import feedback_key
+from data.locations import LOCATIONS, LOCATION_ALIASES
+from data.master_data import MASTER_COLUMNS
+from data.professions import PROFESSIONS
+from data.sources import SPREADSHEET_TIMEZONE, form_key
+
+# Forms and the share of the responses each one gets. Don't Waste It averages
+# several guideline questions, so its guideline answers can be fractions.
+FORMS = {
+    "Online K-12": 0.6,
+    "Online PD": 0.15,
+    "In-Person General Guidelines": 0.2,
+    "Don't Waste It Eval": 0.05,
+}
+AVERAGED_GUIDELINES_FORM = "Don't Waste It Eval"
+
+# Chance of each answer on the 1 - 5 scale, close to the shape of data/data.csv
+RATING_WEIGHTS = [0.01, 0.02, 0.07, 0.25, 0.65]
+GUIDELINES_BEFORE_WEIGHTS = [0.3, 0.4, 0.25, 0.03, 0.02]
+GUIDELINES_AFTER_WEIGHTS = [0.0, 0.02, 0.18, 0.45, 0.35]
+
+# Share of questions left blank
+MISSING_RATE = 0.01
+
+# Answers typed into "Other" on the profession question
+OTHER_PROFESSIONS = ["Graduate Student", "Student", "Volunteer", "Park Ranger", "Resource Developer", "Retired", "Librarian"]
+
+# Words the free-text feedback is made of
+FEEDBACK_WORDS = (
+    "great helpful engaging clear useful enjoyed loved interesting practical organized "
+    "confusing long boring slow difficult unclear rushed outdated "
+    "course instructor activities examples videos modules guidelines students lessons time outdoor content"
+).split()
+
+# Feedback questions asked on every form
+FEEDBACK_FIELDS = ["general_feedback", "instructor_feedback", "accessibility_feedback", "structure_feedback", "topics_feedback"]
+
+# Words used for the 1 - 5 answers in a spreadsheet export
+ANSWER_WORDS = {1: "Very Low", 2: "Low", 3: "Average", 4: "High", 5: "Very High"}
+
+class Document:
+    """
+    Stands in for a Firestore DocumentSnapshot, so the real ingest code can
+    be timed without a database.
+    """
+
+    def __init__(self, id, data):
+        self.id = id
+        self.data = data
+
+    def to_dict(self):
+        return dict(self.data)
+
+    def get(self, field):
+        return self.data[field]
+
+def choose(rng, values, n, weights=None):
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=n, p=weights)]
+
+def blank(rng, values):
+    # Leaves a share of the answers empty, the form scripts store those as "N/A"
+    values = values.astype(object)
+    values[rng.random(len(values)) < MISSING_RATE] = "N/A"
+    return values
+
+def professions(rng, n):
+    # One or two of the listed options, sometimes with a typed in answer
+    first = choose(rng, PROFESSIONS, n, [0.6, 0.1, 0.08, 0.07, 0.15])
+    second = choose(rng, PROFESSIONS, n)
+    other = choose(rng, OTHER_PROFESSIONS, n)
+
+    # Typed in answers are rarely spelled the same way twice
+    other = other + np.where(rng.random(n) < 0.2, " " + rng.integers(0, max(n // 100, 1), n).astype(str), "")
+
+    kind = rng.random(n)
+    answers = np.where(kind < 0.7, first, first + ", " + second)
+    answers = np.where(kind > 0.9, first + ", " + other, answers)
+    return np.where(kind > 0.97, other, answers)
+
+def student_counts(rng, n):
+    counts = np.rint(rng.lognormal(5, 1.5, n)).astype("int64").astype(str).astype(object)
+    text = rng.random(n)
+    counts[text < 0.02] = "about 200"
+    counts[text > 0.99] = "N/A"
+    return counts
+
+def feedback_text(rng, n):
+    lengths = rng.integers(3, 25, n)
+    words = choose(rng, FEEDBACK_WORDS, lengths.sum())
+    comments = np.split(words, np.cumsum(lengths)[:-1])
+    text = np.array([" ".join(comment).capitalize() for comment in comments], dtype=object)
+    text[rng.random(n) < 0.4] = "N/A"
+    return text
+
+def generate_responses(n, seed=0, start=datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)):
+    """
+    n synthetic responses with the fields the form scripts write to
+    master_data, answers already coded to 1 - 5, plus the feedback fields
+    written to the form collections. Returns one row per response.
+    """
+    rng = np.random.default_rng(seed)
+    forms = choose(rng, list(FORMS), n, list(FORMS.values()))
+    seconds = np.sort(rng.integers(0, 3 * 365 * 24 * 3600, n))
+
+    responses = {
+        "form_name": np.array([form_key(form) for form in forms], dtype=object),
+        "timestamp": pd.Timestamp(start) + pd.to_timedelta(seconds, unit="s"),
+    }
+    for field, column in MASTER_COLUMNS.items():
+        if column in ("Form Name", "Timestamp"):
+            continue
+        if column == "Guidelines Before":
+            responses[field] = blank(rng, rng.choice(5, n, p=GUIDELINES_BEFORE_WEIGHTS) + 1)
+        elif column == "Guidelines After":
+            responses[field] = blank(rng, rng.choice(5, n, p=GUIDELINES_AFTER_WEIGHTS) + 1)
+        elif column == "Current Profession":
+            responses[field] = professions(rng, n)
+        elif column == "Student Count":
+            responses[field] = student_counts(rng, n)
+        elif column == "Student Location":
+            responses[field] = choose(rng, LOCATIONS + list(LOCATION_ALIASES) + ["N/A"], n, [0.45, 0.18, 0.17, 0.12, 0.06, 0.02])
+        else:
+            responses[field] = blank(rng, rng.choice(5, n, p=RATING_WEIGHTS) + 1)
+
+    # The averaged guideline questions of Don't Waste It
+    averaged = forms == AVERAGED_GUIDELINES_FORM
+    for field in ["guidelines_before", "guidelines_after"]:
+        responses[field][averaged] = np.round(rng.uniform(1, 5, averaged.sum()) * 3) / 3
+
+    for field in FEEDBACK_FIELDS:
+        responses[field] = feedback_text(rng, n)
+
+    frame = pd.DataFrame(responses)
+    frame.index = pd.Index([f"row{i}" for i in range(n)], dtype=object)
+    return frame
+
+def to_documents(responses):
+    # master_data documents, the way Firestore hands them to documents_to_frame
+    fields = list(MASTER_COLUMNS)
+    records = responses[fields].to_dict("records")
+    return [Document(id, record) for id, record in zip(responses.index, records)]
+
+def to_export(responses):
+    # Same rows as a Google Sheets export shaped like data/data.csv
+    names = {form_key(form): form for form in FORMS}
+    export = pd.DataFrame({column: responses[field] for field, column in MASTER_COLUMNS.items()})
+    export["Form Name"] = export["Form Name"].map(names)
+    # Sheets shows the local time of the spreadsheet
+    export["Timestamp"] = responses["timestamp"].dt.tz_convert(SPREADSHEET_TIMEZONE).dt.strftime("%m/%d/%Y %H:%M:%S")
+    for column in ["Guidelines Before", "Guidelines After", "Sharing Interest"]:
+        export[column] = export[column].map(lambda value: ANSWER_WORDS.get(value, value))
+    for field in FEEDBACK_FIELDS:
+        export[field.replace("_", " ").title()] = responses[field]
+    return export.replace("N/A", "")
+
+def to_feedback(responses):
+    # {form: {feedback type: [comments]}}, the shape load_feedback_data returns
+    names = {form_key(form): form for form in FORMS}
+    feedback = {}
+    for form, rows in responses.groupby("form_name", sort=False):
+        feedback[feedback_key(names[form])] = {field: rows[field].tolist() for field in FEEDBACK_FIELDS}
+    return feedback
@@ -0,0 +1,212 @@
+import numpy as np
+import pandas as pd
+from data.coding import scale_labels
+from data.schema import RATING_COLUMNS, GUIDELINE_COLUMNS
+from data.professions import profession_indicators, count_professions
+from data.locations import LOCATIONS, student_count_statistics, student_count_values
+from data.guidelines import transition_counts
+
+# Value used by the pages for "no filter"
+ALL = "All"
+
+# Columns the cube is grouped by
+DIMENSIONS = ["Form Name", "Student Location", "Current Profession"]
+
+# Columns that get a count, sum and 1 - 5 distribution in every cell of the cube
+MEASURE_COLUMNS = RATING_COLUMNS + GUIDELINE_COLUMNS
+SCALE = [1, 2, 3, 4, 5]
+
+# Levels the guidelines answers are also counted at or above, so averaged answers are not rounded up into "High"
+THRESHOLDS = [4, 5]
+
+def dimension_values(column):
+    # Missing answers get their own group instead of being dropped
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        if column.isna().any():
+            column = column.cat.add_categories("N/A").fillna("N/A")
+        return column
+    return column.fillna("N/A")
+
+def group_measures(frame):
+    """
+    Measures summed per form x location x profession, with plain values in
+    the index so cubes can be added together. Every measure is counted
+    from its coded column with the row's group number, so no table with
+    a column per measure is built for the rows.
+    """
+    keys = [dimension_values(frame[dimension]) for dimension in DIMENSIONS]
+    grouped = frame.groupby(keys, observed=True)
+    groups = grouped.ngroup().to_numpy()
+    index = grouped.size().index
+    count = len(index)
+
+    measures = {("Responses", "n"): np.bincount(groups, minlength=count)}
+    for column in MEASURE_COLUMNS:
+        values = frame[column].astype("float64").to_numpy()
+        answered = ~np.isnan(values)
+        values, answered_groups = values[answered], groups[answered]
+        measures[(column, "n")] = np.bincount(answered_groups, minlength=count)
+        measures[(column, "sum")] = np.bincount(answered_groups, weights=values, minlength=count).astype("float64")
+
+        # Same buckets as pd.cut with bins 0, 1, 2, 3, 4, 5, so averaged guidelines land on the next whole rating
+        buckets = np.ceil(values)
+        on_scale = (buckets >= 1) & (buckets <= len(SCALE))
+        positions = answered_groups[on_scale] * len(SCALE) + buckets[on_scale].astype("int64") - 1
+        counts = np.bincount(positions, minlength=count * len(SCALE)).reshape(count, len(SCALE))
+        for position, value in enumerate(SCALE):
+            measures[(column, value)] = counts[:, position]
+
+        if column in GUIDELINE_COLUMNS:
+            for value in THRESHOLDS:
+                measures[(column, f">= {value}")] = np.bincount(answered_groups[values >= value], minlength=count)
+
+    # Before x after guidelines pairs, for the transition matrix
+    measures.update(transition_counts(frame, groups, count))
+
+    student_count = frame["Student Count"].astype("float64").to_numpy()
+    answered = ~np.isnan(student_count)
+    measures[("Student Count", "n")] = np.bincount(groups[answered], minlength=count)
+    measures[("Student Count", "sum")] = np.bincount(groups[answered], weights=student_count[answered], minlength=count).astype("float64")
+
+    cells = pd.DataFrame(measures, index=index)
+    cells.index = cells.index.set_levels([level.astype(object) for level in cells.index.levels])
+    return cells
+
+def count_student_values(frame):
+    # Responses per form, location and student count answer, grouped like the cube
+    return student_count_values(frame, dimension_values(frame["Form Name"]), dimension_values(frame["Student Location"]))
+
+class AggregateCube:
+    """
+    Per form x location x profession counts and rating sums, built once for
+    every version of the master data. Pages read a view for their filters
+    with a dictionary lookup instead of rescanning the rows.
+    """
+
+    def __init__(self, frame, cells=None, student_values=None, indicators=None):
+        self.cells = group_measures(frame) if cells is None else cells
+        self.empty = pd.Series(0, index=self.cells.columns, dtype="float64")
+
+        # Rolls the cells up into every form and location combination, including "All"
+        self.views = {(ALL, ALL): self.cells.sum()}
+        for form, row in self.cells.groupby(level=0, observed=True).sum().iterrows():
+            self.views[(form, ALL)] = row
+        for location, row in self.cells.groupby(level=1, observed=True).sum().iterrows():
+            self.views[(ALL, location)] = row
+        for (form, location), row in self.cells.groupby(level=[0, 1], observed=True).sum().iterrows():
+            self.views[(form, location)] = row
+
+        # Number of responses per profession answer for every form
+        responses = self.cells[("Responses", "n")]
+        by_form = responses.groupby(level=[0, 2], observed=True).sum()
+        self.professions = {ALL: responses.groupby(level=2, observed=True).sum()}
+        for form in self.forms():
+            self.professions[form] = by_form.loc[form]
+
+        # Splits every distinct multi-select profession answer into its buckets once, reusing the answers already split
+        self.profession_indicators = profession_indicators(self.professions[ALL].index, indicators)
+
+        # Student count summary for every form and location, from the number of responses per answer
+        self.student_values = count_student_values(frame) if student_values is None else student_values
+        self.student_counts = student_count_statistics(self.student_values, responses.groupby(level=[0, 1]).sum(), ALL)
+
+        # Locations that have at least one response in every form
+        self.locations = {ALL: sorted(self.cells.index.get_level_values(1).unique())}
+        for form, location in sorted(self.cells.index.droplevel(2).unique()):
+            self.locations.setdefault(form, []).append(location)
+
+    def updated(self, frame, removed, added):
+        """
+        Cube of frame, which is this cube's rows without removed and with
+        added, built by adding and subtracting only the changed rows' cells.
+        """
+        cells = self.cells.add(group_measures(added), fill_value=0).sub(group_measures(removed), fill_value=0)
+        cells = cells[cells[("Responses", "n")] > 0].astype(self.cells.dtypes.to_dict())
+        student_values = self.student_values.add(count_student_values(added), fill_value=0).sub(count_student_values(removed), fill_value=0)
+        student_values = student_values[student_values > 0].astype("int64")
+        return AggregateCube(frame, cells, student_values, self.profession_indicators)
+
+    def form_sizes(self):
+        # Number of responses of every form key, "N/A" for rows without a form name
+        return self.cells[("Responses", "n")].groupby(level=0).sum()
+
+    def forms(self):
+        return sorted(self.cells.index.get_level_values(0).unique())
+
+    def view(self, form=ALL, location=ALL):
+        return self.views.get((form, location), self.empty)
+
+    def profession_counts(self, form=ALL):
+        counts = self.professions.get(form, pd.Series(dtype="int64"))
+        return counts[counts.index != "N/A"]
+
+    def profession_totals(self, form=ALL):
+        # Responses per profession bucket, an answer with several professions counts towards each of them
+        return count_professions(self.professions.get(form, pd.Series(dtype="int64")), self.profession_indicators)
+
+    def student_count_summary(self, form=ALL, location=ALL):
+        if (form, location) not in self.student_counts.index:
+            return pd.Series(float("nan"), index=self.student_counts.columns).fillna({"Number of instructors": 0})
+        return self.student_counts.loc[(form, location)]
+
+    def location_table(self, form=ALL):
+        # Student count statistics of the selected form for every location
+        table = pd.DataFrame([self.student_count_summary(form, location) for location in LOCATIONS])
+        table["Number of instructors"] = table["Number of instructors"].astype("int64")
+        table.insert(0, "Location", LOCATIONS)
+        return table.reset_index(drop=True)
+
+    def location_ratings(self, form, column):
+        # Location x 1 - 5 answer counts of a rating column
+        table = pd.DataFrame([distribution(self.view(form, location), column) for location in LOCATIONS])
+        table.columns = [str(value) for value in SCALE]
+        table.insert(0, "Student Location", LOCATIONS)
+        return table.reset_index(drop=True)
+
+    def location_options(self, form=ALL):
+        return [location for location in self.locations.get(form, []) if location != "N/A"]
+
+def responses(view):
+    return int(view[("Responses", "n")])
+
+def mean(view, column):
+    # NaN when nobody answered, like the mean of an empty column
+    count = view[(column, "n")]
+    if count == 0:
+        return float("nan")
+    return view[(column, "sum")] / count
+
+def at_least(view, column, value):
+    # Number of guidelines answers at or above a level of the scale, without rounding
+    return int(view[(column, f">= {value}")])
+
+def distribution(view, column, labelled=False):
+    # Number of answers for each value of the 1 - 5 scale, indexed by the labels of the column's scale when labelled
+    counts = pd.Series([int(view[(column, value)]) for value in SCALE], index=SCALE)
+    return counts.set_axis(scale_labels(column)) if labelled else counts
+
+def rating_statistics(view, columns=RATING_COLUMNS):
+    """
+    Number of answers for each value of the 1 - 5 scale, plus n, mean,
+    median and mode, for several columns at once, one row per column.
+    Unanswered questions are left out, so a column nobody answered has an
+    n of 0 and NaN statistics.
+    """
+    counts = np.array([[view[(column, value)] for value in SCALE] for column in columns], dtype="int64").reshape(len(columns), len(SCALE))
+    answers = np.array([view[(column, "n")] for column in columns], dtype="int64")
+    sums = np.array([view[(column, "sum")] for column in columns], dtype="float64")
+    total = counts.sum(axis=1)
+    scale = np.array(SCALE, dtype="float64")
+
+    # First value whose cumulative count reaches the middle answer, the two middle ones for an even count
+    cumulative = counts.cumsum(axis=1)
+    lower = scale[(cumulative < ((total + 1) // 2)[:, None]).sum(axis=1).clip(max=len(SCALE) - 1)]
+    upper = scale[(cumulative < (total // 2 + 1)[:, None]).sum(axis=1).clip(max=len(SCALE) - 1)]
+
+    statistics = pd.DataFrame(counts, index=pd.Index(columns), columns=SCALE)
+    statistics["n"] = answers
+    statistics["mean"] = np.divide(sums, answers, out=np.full(len(columns), np.nan), where=answers > 0)
+    statistics["median"] = np.where(total > 0, (lower + upper) / 2, np.nan)
+    # The lowest answer on ties, like Series.mode
+    statistics["mode"] = np.where(total > 0, scale[counts.argmax(axis=1)], np.nan)
+    return statistics
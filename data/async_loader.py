@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from data.feedback_data import documents_feedback, feedback_key
+
+# Documents read per request, every collection is read a page at a time
+PAGE_SIZE = int(os.environ.get("EENC_FIRESTORE_PAGE_SIZE", 1000))
+
+# Upper bound on the number of page requests in flight at the same time
+MAX_CONCURRENCY = int(os.environ.get("EENC_FIRESTORE_CONCURRENCY", 8))
+
+async def read_pages(query, limiter, page_size=PAGE_SIZE, order="__name__"):
+    """
+    Every document of an async query, read a page at a time with a cursor on
+    the last document of the previous page. Each page waits for a slot of
+    the limiter, so collections read together share the same bound.
+    """
+    documents = []
+    ordered = query.order_by(order).limit(page_size)
+    page = None
+    while page is None or len(page) == page_size:
+        cursor = ordered if page is None else ordered.start_after(page[-1])
+        async with limiter:
+            page = list(await cursor.get())
+        documents.extend(page)
+    return documents
+
+async def read_collections(queries, page_size=PAGE_SIZE, max_concurrency=MAX_CONCURRENCY):
+    """
+    {name: documents} of several (query, order) pairs read at the same time,
+    so the whole read takes about as long as the largest collection.
+    """
+    limiter = asyncio.Semaphore(max_concurrency)
+    reads = [read_pages(query, limiter, page_size, order) for query, order in queries.values()]
+    return dict(zip(queries, await asyncio.gather(*reads)))
+
+async def load_collections(db, loader, full=False, page_size=PAGE_SIZE, max_concurrency=MAX_CONCURRENCY):
+    """
+    master_data documents and {collection: documents} of every form
+    collection, read together with an AsyncClient. master_data is read
+    through the loader's query, the whole collection or only what is new.
+    """
+    collections = [collection.id async for collection in db.collections()]
+    queries = {name: (db.collection(name), "__name__") for name in collections if name != loader.collection}
+
+    # A query with a range on the timestamp has to be ordered by it first
+    incremental = not full and loader.watermark is not None
+    queries[loader.collection] = (loader.query(db, full), "timestamp" if incremental else "__name__")
+
+    documents = await read_collections(queries, page_size, max_concurrency)
+    return documents.pop(loader.collection), documents
+
+class AsyncFirestoreLoader:
+    """
+    Reads master_data and every form collection concurrently with the async
+    client, in place of MasterDataLoader.refresh() followed by
+    load_feedback_data(). Runs its own event loop, which the async client's
+    channels stay bound to, so it can be called from any one thread at a time.
+    """
+
+    def __init__(self, db, loader, page_size=PAGE_SIZE, max_concurrency=MAX_CONCURRENCY):
+        self.db = db
+        self.loader = loader
+        self.page_size = page_size
+        self.max_concurrency = max_concurrency
+        self.loop = asyncio.new_event_loop()
+
+    def load(self, full=False):
+        # (master data frame, {form name: {feedback type: [comments]}})
+        master, forms = self.loop.run_until_complete(load_collections(self.db, self.loader, full, self.page_size, self.max_concurrency))
+        feedback = {feedback_key(collection): documents_feedback(documents) for collection, documents in forms.items()}
+        return self.loader.merge(master, full=full), feedback
+
+if __name__ == "__main__":
+    # Times one load, and with --compare checks it against the synchronous loaders
+    from google.cloud import firestore
+    from data.feedback_data import load_feedback_data
+    from data.master_data import MasterDataLoader
+
+    parser = argparse.ArgumentParser(description="Loads master_data and the form collections with the async client")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument("--compare", action="store_true", help="also load with the synchronous client and compare")
+    parser.add_argument("--project", help="project ID, needed with the Firestore emulator")
+    options = parser.parse_args()
+
+    if os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        # The emulator takes any project and needs no key
+        credentials = {"project": options.project or "eenc-dashboard"}
+    else:
+        from google.oauth2 import service_account
+
+        # Authenticate to Firestore with the JSON account key, like data/feedback_data.py
+        with open(os.getcwd() + "/.streamlit/firestore-key.json") as user_file:
+            key_dict = json.loads(user_file.read())
+        credentials = {"credentials": service_account.Credentials.from_service_account_info(key_dict)}
+
+    started = time.perf_counter()
+    async_loader = AsyncFirestoreLoader(firestore.AsyncClient(**credentials), MasterDataLoader(None), options.page_size, options.max_concurrency)
+    master, feedback = async_loader.load(full=True)
+    print("Async load:", len(master), "responses,", len(feedback), "forms in", round(time.perf_counter() - started, 2), "seconds")
+
+    if options.compare:
+        db = firestore.Client(**credentials)
+        started = time.perf_counter()
+        sync_master = MasterDataLoader(db).refresh(full=True)
+        sync_feedback = load_feedback_data(db)
+        print("Sync load:", len(sync_master), "responses,", len(sync_feedback), "forms in", round(time.perf_counter() - started, 2), "seconds")
+
+        # Both read the collections in document ID order, so the results match row for row
+        print("Same master data:", master.equals(sync_master), "- same feedback:", feedback == sync_feedback)
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+# Labels of every answer scale in the order of their codes, starting at 1. The form
+# scripts stop the interest scale at 4, "Very Interested".
+SCALES = {
+    "level": ["Very Low", "Low", "Average", "High", "Very High"],
+    "interest": ["Not At All Interested", "Probably Not", "Potentially Interested", "Very Interested"],
+    "agreement": ["Strongly Disagree", "Disagree", "Unsure", "Agree", "Strongly Agree"],
+}
+
+# Scale of the questions the forms ask with labels rather than numbers
+COLUMN_SCALES = {
+    "Guidelines Before": "level",
+    "Guidelines After": "level",
+    "Sharing Interest": "level",
+}
+
+# Same coding as dataCoding in form-scripts/main-control.js, any label of any scale without case
+ANSWER_CODES = {label.lower(): code for labels in SCALES.values() for code, label in enumerate(labels, 1)}
+
+# Lookup table of ANSWER_CODES
+LABEL_INDEX = pd.Index(list(ANSWER_CODES), dtype=object)
+LABEL_CODES = np.array(list(ANSWER_CODES.values()), dtype="float64")
+
+# Answers of unanswered questions, after lowercasing
+UNANSWERED = ["", "n/a"]
+
+def scale_labels(column):
+    # Labels of the column's scale, None for questions answered with numbers
+    scale = COLUMN_SCALES.get(column)
+    return None if scale is None else SCALES[scale]
+
+def distinct_answers(values):
+    """
+    Looks up every distinct answer of a column once. Returns the position of
+    each row's answer among the distinct answers (-1 for missing values),
+    the distinct answers, their codes (NaN when not a label) and whether
+    they leave the question unanswered.
+    """
+    positions, answers = pd.factorize(pd.Series(values, dtype=object))
+    answers = pd.Series(answers, dtype=object)
+    text = answers.where(answers.map(lambda answer: isinstance(answer, str)))
+    normalized = text.str.strip().str.lower()
+    found = LABEL_INDEX.get_indexer(normalized)
+    codes = np.where(found >= 0, LABEL_CODES[found], np.nan)
+    return positions, answers, codes, normalized.isin(UNANSWERED).to_numpy()
+
+def encode(values, unknown="missing"):
+    """
+    Numeric view of a column of answers: labels become their 1 - 5 code,
+    numbers typed as text become numbers and unanswered questions NaN.
+    Other answers become NaN as well, or raise a ValueError naming them
+    when unknown is "raise".
+    """
+    positions, answers, codes, unanswered = distinct_answers(values)
+    numbers = pd.to_numeric(answers.where(np.isnan(codes) & ~unanswered), errors="coerce").to_numpy(dtype="float64")
+    coded = np.where(np.isnan(codes), numbers, codes)
+
+    if unknown == "raise":
+        unknowns = answers[np.isnan(coded) & ~unanswered]
+        if len(unknowns) > 0:
+            raise ValueError(f"Answers not on any scale: {', '.join(repr(answer) for answer in unknowns[:10])}")
+    elif unknown != "missing":
+        raise ValueError(f"Unknown answers are either 'missing' or 'raise', not '{unknown}'")
+
+    # Position -1 takes the NaN appended at the end
+    return pd.Series(np.append(coded, np.nan)[positions], index=getattr(values, "index", None), name=getattr(values, "name", None))
+
+def code_answers(values):
+    """
+    A column coded the way the form scripts write it to Firestore: labels
+    become their code and unanswered questions "N/A". Numbers typed as text
+    are written as numbers, like Sheets hands them to the scripts, and
+    every other answer is written as it is.
+    """
+    positions, answers, codes, unanswered = distinct_answers(values)
+    numbers = pd.to_numeric(answers.where(answers.map(lambda answer: isinstance(answer, str)) & np.isnan(codes) & ~unanswered), errors="coerce")
+
+    written = []
+    for answer, code, number, empty in zip(answers, codes, numbers, unanswered):
+        if empty:
+            written.append("N/A")
+        elif not np.isnan(code):
+            written.append(int(code))
+        elif not np.isnan(number):
+            written.append(int(number) if float(number).is_integer() else float(number))
+        else:
+            written.append(answer)
+    return pd.Series(np.array(written + ["N/A"], dtype=object)[positions], index=getattr(values, "index", None), name=getattr(values, "name", None))
+
+def decode(values, scale="level"):
+    """
+    Label view of a column of codes, as an ordered categorical. Averaged
+    answers land on the next whole level, like the 1 - 5 buckets of the
+    aggregate cube, and codes off the scale become missing.
+    """
+    labels = SCALES[scale]
+    levels = np.ceil(pd.Series(values).astype("float64").to_numpy())
+    on_scale = (levels >= 1) & (levels <= len(labels))
+    positions = np.where(on_scale, np.nan_to_num(levels) - 1, -1).astype("int64")
+    return pd.Series(pd.Categorical.from_codes(positions, categories=labels, ordered=True), index=getattr(values, "index", None), name=getattr(values, "name", None))
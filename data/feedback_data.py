@@ -1,59 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import firestore
 from google.oauth2 import service_account
 import json
 import os
-import pandas as pd
 
-# Get the directory of the file with secret key and firestore information
-secret_file = os.getcwd() + "/.streamlit/firestore-key.json"
+# Upper bound on the number of collections streamed at the same time
+MAX_WORKERS = 8
 
-# Authenticate to Firestore with the JSON account key.
-with open(secret_file) as user_file:
-  file_contents = user_file.read()
-
-key_dict = json.loads(file_contents)
-creds = service_account.Credentials.from_service_account_info(key_dict)
-db = firestore.Client(credentials=creds)
-
-# Obtain access to all collection names
-
-collections = [c.id for c in db.collections()]
-collections.remove("master_data")
-feedback_dic = {}
-
-# Iterate through each collection and obtain the feedback documents into a dataframe style dictionary
-
-for collection in collections:
-  collection_ref = db.collection(collection)
-
-  # Checks if the collection is empty
-
-  try:
-    doc_ref = collection_ref.document("row0")
-  except:
-    print("No document in collection", collection)
-
-  # Gets all the keys in the document
-
-  all_keys = doc_ref.get().to_dict().keys()
-
-  # Gets all the keys that contain the word "feedback" and removes the None values
-
-  feedback_keys = [key if "feedback" in key else None for key in all_keys]
-  feedback_keys = [key for key in feedback_keys if key is not None]
+def feedback_key(collection):
+  # Name of a form collection in the feedback dictionary
+  return collection.lower().replace(" ", "_")
 
+def documents_feedback(documents):
   # Creates a dictionary of arrays with the feedback keys as the keys and the feedback as the values
-
   feedback_documents = {}
-  for document in collection_ref.stream():
-    for key in feedback_keys:
-      if key in feedback_documents:
-        feedback_documents[key].append(document.to_dict()[key])
-      else:
-        feedback_documents[key] = [document.to_dict()[key]]
-
-  # Adds the dictionary to the feedback dictionary
-
-  feedback_dic[collection] = feedback_documents
-
-print(feedback_dic)
\ No newline at end of file
+  row_count = 0
+
+  # Materializes each document a single time
+  for document in documents:
+    data = document.to_dict()
+    for key, value in data.items():
+      if "feedback" not in key:
+        continue
+      if key not in feedback_documents:
+        # Pads a key first seen part way through so every column stays aligned with the rows
+        feedback_documents[key] = ["N/A"] * row_count
+      feedback_documents[key].append(value)
+
+    row_count += 1
+    # Pads the keys this document did not have
+    for values in feedback_documents.values():
+      if len(values) < row_count:
+        values.append("N/A")
+
+  return feedback_documents
+
+def read_collection_feedback(collection_ref):
+  # Streams the collection once
+  return documents_feedback(collection_ref.stream())
+
+def load_feedback_data(db, max_workers=MAX_WORKERS):
+  # Obtain access to all collection names
+  collections = [c.id for c in db.collections()]
+  if "master_data" in collections:
+    collections.remove("master_data")
+
+  if len(collections) == 0:
+    return {}
+
+  # Streams the form collections concurrently with a bounded pool of threads
+  with ThreadPoolExecutor(max_workers=min(max_workers, len(collections))) as executor:
+    results = executor.map(lambda collection: read_collection_feedback(db.collection(collection)), collections)
+
+    # Adds each collection's dictionary to the feedback dictionary
+    return {feedback_key(collection): feedback for collection, feedback in zip(collections, results)}
+
+if __name__ == "__main__":
+  # Get the directory of the file with secret key and firestore information
+  secret_file = os.getcwd() + "/.streamlit/firestore-key.json"
+
+  # Authenticate to Firestore with the JSON account key.
+  with open(secret_file) as user_file:
+    file_contents = user_file.read()
+
+  key_dict = json.loads(file_contents)
+  creds = service_account.Credentials.from_service_account_info(key_dict)
+  db = firestore.Client(credentials=creds)
+
+  print(load_feedback_data(db))
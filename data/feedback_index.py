@@ -0,0 +1,89 @@
+import numpy as np
+from data.aggregates import ALL
+
+# Feedback questions in the order the pages show them, any others follow alphabetically
+FEEDBACK_TYPES = [
+    "general_feedback",
+    "instructor_feedback",
+    "accessibility_feedback",
+    "rating_feedback",
+    "structure_feedback",
+    "topics_feedback",
+    "activity_removal_feedback",
+]
+
+def answered(comments):
+    # Leaves out unanswered questions, stored as "N/A" or left empty
+    texts = []
+    for comment in comments:
+        if comment is None:
+            continue
+        text = str(comment)
+        if text.strip() != "" and text.lower() != "n/a":
+            texts.append(text)
+    return texts
+
+def feedback_title(feedback_type):
+    return " ".join([word.capitalize() for word in feedback_type.split("_")])
+
+class FeedbackIndex:
+    """
+    Answered comments by form and feedback type, built once per feedback
+    load. The "All" entries list every form's comments one form after the
+    other, so forms asking the same question no longer overwrite each other.
+    Pages slice out the comments they show instead of filtering every list.
+    """
+
+    def __init__(self, feedback):
+        self.comments = {}
+        for form in sorted(feedback):
+            for feedback_type, values in feedback[form].items():
+                values = answered(values)
+                if len(values) > 0:
+                    self.comments[(form, feedback_type)] = values
+                    self.comments.setdefault((ALL, feedback_type), []).extend(values)
+
+    def types(self, form=ALL):
+        # Feedback types with at least one answer for the form
+        found = {feedback_type for key, feedback_type in self.comments if key == form}
+        known = [feedback_type for feedback_type in FEEDBACK_TYPES if feedback_type in found]
+        return known + sorted(found - set(FEEDBACK_TYPES))
+
+    def count(self, form, feedback_type):
+        return len(self.comments.get((form, feedback_type), []))
+
+    def page(self, form, feedback_type, start, stop):
+        return self.comments.get((form, feedback_type), [])[start:stop]
+
+class SegmentFeedbackIndex(FeedbackIndex):
+    """
+    The same index over the comments a search index already holds (see
+    data/search.py), for workers of a data host. A form's comments of one
+    feedback type are one run of its segment, so pages are sliced out of
+    the shared Arrow arrays instead of lists of strings.
+    """
+
+    def __init__(self, search):
+        # (texts, start, stop) runs of every form and feedback type, "All" lists them one form after the other
+        self.comments = {}
+        for form in sorted(search.segments):
+            segment = search.segments[form]
+            for code, feedback_type in enumerate(segment.type_names):
+                rows = np.flatnonzero(segment.types == code)
+                if len(rows) > 0:
+                    run = (segment.texts, int(rows[0]), int(rows[-1]) + 1)
+                    self.comments[(form, feedback_type)] = [run]
+                    self.comments.setdefault((ALL, feedback_type), []).append(run)
+
+    def count(self, form, feedback_type):
+        return sum(stop - start for _, start, stop in self.comments.get((form, feedback_type), []))
+
+    def page(self, form, feedback_type, start, stop):
+        texts = []
+        for comments, first, last in self.comments.get((form, feedback_type), []):
+            length = last - first
+            if start < length and stop > 0:
+                texts.extend(comments.slice(first + max(start, 0), min(stop, length) - max(start, 0)).to_pylist())
+            start -= length
+            stop -= length
+        return texts
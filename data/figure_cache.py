@@ -0,0 +1,93 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from data.timing import timed
+
+# Upper bound on the serialized size of all cached figures, 64 MB by default
+MAX_BYTES = int(os.environ.get("EENC_FIGURE_CACHE_BYTES", 64 * 1024 * 1024))
+
+# Bytes charged for every value of a numeric array, about the length of a number in the figure's JSON
+VALUE_BYTES = 12
+
+def serialized_size(value):
+    """
+    Estimated length of value in a figure's JSON, from the length of its
+    strings and the number of values in its arrays, without serializing it.
+    """
+    if isinstance(value, str):
+        return len(value) + 3
+    if isinstance(value, dict):
+        return sum(len(key) + 4 + serialized_size(item) for key, item in value.items()) + 2
+    if isinstance(value, np.ndarray) and value.dtype.kind in "biuf":
+        return value.size * VALUE_BYTES + 2
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return sum(serialized_size(item) + 1 for item in value) + 2
+    return VALUE_BYTES
+
+def figure_size(figure):
+    # Reads the figure's own trace and layout dictionaries, to_dict() and to_json() would copy them first
+    return serialized_size(figure._data) + serialized_size(figure._layout)
+
+class FigureCache:
+    """
+    Process-wide least recently used cache of finished Plotly figures, shared
+    by every session. Keys hold the data version, so a refresh never serves
+    an old chart, and every entry is charged an estimate of its serialized
+    size against the byte budget. Streamlit serializes the figure when it
+    is drawn, so the cache does not serialize it a second time.
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, build):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+
+        # Builds outside the lock so a slow chart doesn't hold up the others
+        figure = build()
+        size = figure_size(figure)
+
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            if size <= self.max_bytes:
+                self.entries[key] = (figure, size)
+                self.size += size
+
+            # Drops the least recently used figures until the cache fits its budget again
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+
+        return figure
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+# Shared by every page and session in this server process
+FIGURES = FigureCache()
+
+def cached_figure(version, page, chart, filters, build):
+    """
+    Returns the figure for this data version, page, chart and filter values,
+    calling build() only when no session has drawn it yet. The figure is
+    shared, so it must not be modified after it is returned.
+    """
+    def timed_build():
+        with timed(f"{page}: build {chart}"):
+            return build()
+
+    return FIGURES.get((version, page, chart, tuple(filters)), timed_build)
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+from data.coding import SCALES
+
+# Answers to the guidelines questions, in the order of the 1 - 5 scale
+GUIDELINE_LEVELS = SCALES["level"]
+LEVEL_VALUES = list(range(1, len(GUIDELINE_LEVELS) + 1))
+
+def transition_column(before):
+    # Cube column counting the after answers of the participants whose before answer was the given level
+    return f"Guidelines After, Before {before}"
+
+def transition_counts(frame, groups, group_count):
+    """
+    One column per before x after pair, counting in every group the
+    responses that answered both questions with those levels. groups holds
+    the group number of each row. Averaged answers land on the next whole
+    level, like the before and after distributions.
+    """
+    levels = len(LEVEL_VALUES)
+    before = np.ceil(frame["Guidelines Before"].astype("float64").to_numpy())
+    after = np.ceil(frame["Guidelines After"].astype("float64").to_numpy())
+    answered = (before >= 1) & (before <= levels) & (after >= 1) & (after <= levels)
+    pairs = groups[answered] * levels * levels + (before[answered] - 1).astype("int64") * levels + (after[answered] - 1).astype("int64")
+    counts = np.bincount(pairs, minlength=group_count * levels * levels).reshape(group_count, levels, levels)
+
+    measures = {}
+    for before_position, before_value in enumerate(LEVEL_VALUES):
+        for after_position, after_value in enumerate(LEVEL_VALUES):
+            measures[(transition_column(before_value), after_value)] = counts[:, before_position, after_position]
+    return measures
+
+def transition_matrix(view):
+    # Participants per before (rows) and after (columns) level, from an aggregate cube view
+    counts = [[int(view[(transition_column(before), after)]) for after in LEVEL_VALUES] for before in LEVEL_VALUES]
+    return pd.DataFrame(counts, index=pd.Index(GUIDELINE_LEVELS, name="Before"), columns=pd.Index(GUIDELINE_LEVELS, name="After"))
+
+def gains(matrix):
+    """
+    How the participants who answered both questions moved: how many went
+    up, stayed or went down, and the average change in levels.
+    """
+    counts = matrix.to_numpy()
+    total = int(counts.sum())
+    change = np.subtract.outer(LEVEL_VALUES, LEVEL_VALUES).T
+    return {
+        "Participants": total,
+        "Improved": int(counts[change > 0].sum()),
+        "Unchanged": int(np.trace(counts)),
+        "Declined": int(counts[change < 0].sum()),
+        "Average change": float((counts * change).sum() / total) if total > 0 else float("nan"),
+    }
@@ -0,0 +1,29 @@
+class DatasetHandle:
+    """
+    Read-only access to the dataset of the server process, shared by every
+    session. Sessions keep only their filters and the version they were last
+    shown, never the data, so each one costs the same however large the
+    data is and an old dataset is freed as soon as no rerun is reading it.
+    """
+
+    def __init__(self):
+        self.refresher = None
+
+    def attach(self, refresher):
+        # Called once per process with the refresher that keeps the dataset current
+        self.refresher = refresher
+        return refresher
+
+    def current(self, session_state):
+        """
+        The dataset for one rerun, read once so the whole page is built from
+        the same version. None until the homepage has started the refresher.
+        """
+        if self.refresher is None or self.refresher.dataset is None:
+            return None
+        dataset = self.refresher.dataset
+        session_state["dataset_version"] = dataset.version
+        return dataset
+
+# Shared by every session of the process
+DATASET = DatasetHandle()
@@ -0,0 +1,282 @@
+import datetime
+import getpass
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+import toml
+from data.feedback_index import SegmentFeedbackIndex
+from data.listeners import FirestoreListeners, LIVE_UPDATES
+from data.partitions import FormPartitions
+from data.refresher import Dataset, DataRefresher
+from data.sources import FirestoreSource, configured_source
+from data.snapshot import SEARCH_TABLES, SnapshotStore, frame_from_table, frame_to_table, search_from_tables, search_to_tables, segment_metadata
+
+# Directory the data host publishes to, /dev/shm is kept in memory on Linux. One per
+# user by default, since other users can create files in /dev/shm.
+HOST_DIR = os.environ.get("EENC_DATA_HOST_DIR", f"/dev/shm/eenc-dashboard-{getpass.getuser()}")
+
+# Seconds between checks for a new dataset, on the host, and for a new generation, on the workers
+POLL_INTERVAL = float(os.environ.get("EENC_HOST_POLL_SECONDS", 2))
+
+# Generations kept before the current one, so a worker attaching while the host publishes still finds its files
+KEEP_GENERATIONS = 1
+
+# Names of the files of a generation besides the Arrow tables
+MANIFEST = "manifest.json"
+SUMMARIES = "summaries.pickle"
+RELOAD = "reload"
+
+def read_manifest(directory):
+    # The last published generation, or None before the host published one
+    try:
+        with open(os.path.join(directory, MANIFEST)) as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+
+def check_private(directory):
+    # Workers unpickle the summaries published here, so nobody else may be able to write to it
+    status = os.stat(directory)
+    if status.st_uid != os.getuid() or status.st_mode & 0o022:
+        raise PermissionError(f"{directory} has to belong to this user and not be writable by others, remove it or set EENC_DATA_HOST_DIR")
+
+def write_json(path, data):
+    # Swapped in whole, so readers never see a partial file
+    with open(path + ".tmp", "w") as output:
+        json.dump(data, output)
+    os.replace(path + ".tmp", path)
+
+def refresher_status(refresher):
+    # What the workers report about the host's refresher
+    return {
+        "refreshes": refresher.refreshes,
+        "failures": refresher.failures,
+        "last_duration": refresher.last_duration,
+        "last_refreshed": None if refresher.last_refreshed is None else refresher.last_refreshed.isoformat(),
+        "last_error": refresher.last_error,
+        "refreshing": refresher.refreshing(),
+    }
+
+class DataHost:
+    """
+    Publishes every dataset of one refresher for all the Streamlit worker
+    processes of a deployment, which attach to it with HostedData. Data is
+    loaded, indexed and aggregated once, and the Arrow files are kept in
+    shared memory, where every worker maps the same pages.
+
+    Each dataset is written to a new generation directory and announced by
+    swapping in the manifest, so workers only ever see complete datasets.
+    Tables that did not change are hard links to the previous generation.
+    """
+
+    def __init__(self, refresher, directory=HOST_DIR, interval=POLL_INTERVAL):
+        self.refresher = refresher
+        self.directory = directory
+        self.interval = interval
+        self.published = None
+        manifest = read_manifest(directory)
+        self.generation = 0 if manifest is None else manifest["generation"]
+
+    def generation_path(self, generation):
+        return os.path.join(self.directory, f"generation-{generation}")
+
+    def publish(self, dataset):
+        generation = self.generation + 1
+        previous = self.published
+        path = self.generation_path(generation)
+        store = SnapshotStore(path)
+        # Left over when a host stopped before announcing it
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, mode=0o700)
+
+        if previous is not None and previous.master is dataset.master:
+            self.link(store, ["master_data"])
+        else:
+            table, layout = frame_to_table(dataset.master)
+            store.write("master_data", table, {"layout": layout})
+
+        if previous is not None and previous.search is dataset.search:
+            self.link(store, SEARCH_TABLES)
+        else:
+            forms = [segment_metadata(form, segment) for form, segment in dataset.search.segments.items()]
+            for name, table in search_to_tables(dataset.search).items():
+                store.write(name, table, {"forms": forms})
+
+        # Small enough to copy into every worker, so they are not built again there
+        with open(os.path.join(path, SUMMARIES), "wb") as summaries:
+            pickle.dump({"aggregates": dataset.aggregates, "trends": dataset.trends, "analytics": dataset.analytics.without_cache()}, summaries)
+
+        self.generation = generation
+        self.published = dataset
+        self.announce()
+
+        # Workers keep reading the files they mapped after they are deleted
+        for name in os.listdir(self.directory):
+            if name.startswith("generation-") and int(name.split("-")[1]) < generation - KEEP_GENERATIONS:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def link(self, store, names):
+        # Unchanged tables of the previous generation, linked instead of written again
+        for name in names:
+            os.link(SnapshotStore(self.generation_path(self.generation)).path(name), store.path(name))
+
+    def announce(self):
+        dataset = self.published
+        write_json(os.path.join(self.directory, MANIFEST), {
+            "generation": self.generation,
+            "directory": os.path.basename(self.generation_path(self.generation)),
+            "version": dataset.version,
+            "loaded_at": dataset.loaded_at.isoformat(),
+            "status": refresher_status(self.refresher),
+        })
+
+    def run(self):
+        # Publishes whenever the refresher swaps in a dataset and passes the workers' reload requests on
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        # makedirs leaves a directory that already exists as it is
+        check_private(self.directory)
+        status = None
+        while True:
+            if self.refresher.dataset is not self.published:
+                started = time.perf_counter()
+                try:
+                    self.publish(self.refresher.dataset)
+                    print("Published generation", self.generation, "in", round(time.perf_counter() - started, 2), "seconds")
+                except OSError as error:
+                    # Workers keep the last generation, publishing is tried again on the next check
+                    print("Could not publish generation", self.generation + 1, error)
+            elif refresher_status(self.refresher) != status:
+                self.announce()
+            status = refresher_status(self.refresher)
+
+            request = os.path.join(self.directory, RELOAD)
+            if os.path.exists(request):
+                with open(request) as request_file:
+                    full = request_file.read() == "full"
+                os.remove(request)
+                self.refresher.trigger(full=full)
+            time.sleep(self.interval)
+
+class HostedData:
+    """
+    Stands in for the DataRefresher of a Streamlit worker when a data host
+    loads the data (see DataHost). Attaches to the last generation the host
+    published and to every later one on a background thread, so the worker
+    never loads or aggregates anything itself.
+    """
+
+    def __init__(self, path=HOST_DIR, interval=POLL_INTERVAL):
+        self.directory = path
+        self.interval = interval
+        self.dataset = None
+        self.generation = None
+        self.thread = None
+        self.listeners = None
+        self.status = {}
+
+    def start(self):
+        manifest = read_manifest(self.directory)
+        if manifest is None:
+            raise RuntimeError(f"No dataset published in {self.directory}, start the data host first with python -m data.host")
+        self.attach(manifest)
+        self.thread = threading.Thread(target=self.run, name="data-host-client", daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            manifest = read_manifest(self.directory)
+            if manifest is None:
+                continue
+            self.status = manifest["status"]
+            if manifest["generation"] != self.generation:
+                try:
+                    self.attach(manifest)
+                except (OSError, KeyError, ValueError, TypeError) as error:
+                    # Tried again on the next check, the last dataset keeps being served
+                    print("Could not attach to generation", manifest["generation"], error)
+
+    def attach(self, manifest):
+        check_private(self.directory)
+        store = SnapshotStore(os.path.join(self.directory, manifest["directory"]))
+        snapshot = store.read("master_data")
+        if snapshot is None:
+            raise FileNotFoundError(f"Generation {manifest['generation']} is missing its master data")
+        master = frame_from_table(snapshot[0], snapshot[1]["layout"])
+        master.attrs["version"] = manifest["version"]
+
+        tables = {}
+        for name in SEARCH_TABLES:
+            snapshot = store.read(name)
+            if snapshot is None:
+                raise FileNotFoundError(f"Generation {manifest['generation']} is missing its search index")
+            tables[name], metadata = snapshot
+        search = search_from_tables(tables, metadata["forms"])
+
+        with open(os.path.join(store.directory, SUMMARIES), "rb") as summaries:
+            summaries = pickle.load(summaries)
+
+        # Feedback is only kept as the search index's comments, pages read it through the feedback index
+        self.dataset = Dataset(
+            master,
+            FormPartitions(master),
+            summaries["aggregates"],
+            summaries["trends"],
+            None,
+            SegmentFeedbackIndex(search),
+            search,
+            summaries["analytics"],
+            manifest["version"],
+            datetime.datetime.fromisoformat(manifest["loaded_at"]),
+        )
+        self.generation = manifest["generation"]
+        self.status = manifest["status"]
+
+    def trigger(self, full=False):
+        # Asks the host for a refresh, every worker then attaches to its result
+        request = os.path.join(self.directory, RELOAD)
+        if full or not os.path.exists(request):
+            with open(request, "w") as request_file:
+                request_file.write("full" if full else "")
+
+    def refreshing(self):
+        return self.status.get("refreshing", False) or os.path.exists(os.path.join(self.directory, RELOAD))
+
+    # The host refresher's figures, as the pages report them for a DataRefresher
+
+    @property
+    def refreshes(self):
+        return self.status.get("refreshes", 0)
+
+    @property
+    def failures(self):
+        return self.status.get("failures", 0)
+
+    @property
+    def last_duration(self):
+        return self.status.get("last_duration")
+
+    @property
+    def last_refreshed(self):
+        refreshed = self.status.get("last_refreshed")
+        return None if refreshed is None else datetime.datetime.fromisoformat(refreshed)
+
+    @property
+    def last_error(self):
+        return self.status.get("last_error")
+
+def host_source(secrets_path=".streamlit/secrets.toml"):
+    # The source the dashboard would read, configured the same way
+    secrets = toml.load(secrets_path) if os.path.exists(secrets_path) else {}
+    return configured_source(secrets, hosted=False)
+
+if __name__ == "__main__":
+    source = host_source()
+    refresher = DataRefresher(source).start()
+    if isinstance(source, FirestoreSource) and LIVE_UPDATES:
+        refresher.listeners = FirestoreListeners(source.db, refresher.apply_delta).start()
+    DataHost(refresher).run()
@@ -0,0 +1,161 @@
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import re
+import pandas as pd
+from data.coding import code_answers
+from data.master_data import MASTER_COLUMNS
+from data.sources import SPREADSHEET_TIMEZONE, TIMESTAMP_FORMAT, form_key, utc_timestamps
+
+# Writes a Firestore batch can hold
+BATCH_SIZE = 500
+
+# Upper bound on the number of batches committed at the same time
+MAX_WORKERS = 8
+
+def field_name(header):
+    # "Course Rating" and "course_rating" both become the course_rating field the form scripts write
+    return re.sub(r"[^0-9a-z]+", "_", str(header).strip().lower()).strip("_")
+
+def read_export(path, sheet_name=None):
+    """
+    {form name: rows} of a spreadsheet export. A CSV shaped like
+    data/data.csv has a "Form Name" column, an XLSX can have one sheet per
+    form named after it instead, like the spreadsheet the forms write to.
+    """
+    if path.lower().endswith((".xlsx", ".xls")):
+        sheets = pd.read_excel(path, sheet_name=sheet_name, dtype=object)
+        if not isinstance(sheets, dict):
+            sheets = {sheet_name: sheets}
+    else:
+        sheets = {os.path.splitext(os.path.basename(path))[0]: pd.read_csv(path, dtype=str, keep_default_na=False)}
+
+    forms = {}
+    for name, table in sheets.items():
+        if "Form Name" in table.columns:
+            for form, rows in table.groupby("Form Name", sort=False):
+                forms.setdefault(form, []).append(rows.drop(columns="Form Name"))
+        else:
+            forms.setdefault(name, []).append(table)
+    return {form: pd.concat(tables, ignore_index=True) for form, tables in forms.items()}
+
+def average_guidelines(rows, field):
+    # Forms asking several guidelines questions, e.g. Don't Waste It, store the average of their answers
+    columns = [column for column in rows.columns if column.startswith(field)]
+    if len(columns) > 1:
+        averages = rows[columns].apply(pd.to_numeric, errors="coerce").mean(axis=1)
+        rows[field] = ["N/A" if pd.isna(average) else float(average) for average in averages]
+    return rows
+
+def parse_timestamp(value, timezone=SPREADSHEET_TIMEZONE):
+    # A timestamp in another format as UTC, a local time unless it carries its own offset
+    timestamp = pd.to_datetime(str(value), errors="coerce")
+    if pd.isna(timestamp):
+        return pd.NaT
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize(timezone, ambiguous=False, nonexistent="shift_forward")
+    return timestamp.tz_convert("UTC")
+
+def code_rows(rows, timezone=SPREADSHEET_TIMEZONE):
+    # Field names, coded answers and parsed timestamps of one form's rows
+    rows = rows.rename(columns=field_name)
+    rows = rows.loc[:, ~rows.columns.duplicated()].astype(object)
+    rows = rows.apply(code_answers)
+    if "timestamp" in rows.columns:
+        timestamps = rows["timestamp"].where(rows["timestamp"] != "N/A")
+        # Sheets exports hold the local times of the spreadsheet, XLSX dates included
+        parsed = utc_timestamps(pd.to_datetime(timestamps, format=TIMESTAMP_FORMAT, errors="coerce"), timezone)
+        # Anything not in the Sheets format, e.g. an ISO timestamp, is parsed on its own
+        unparsed = parsed.isna() & timestamps.notna()
+        if unparsed.any():
+            parsed[unparsed] = [parse_timestamp(value, timezone) for value in timestamps[unparsed]]
+        rows["timestamp"] = [None if pd.isna(timestamp) else timestamp.to_pydatetime() for timestamp in parsed]
+    for field in ["guidelines_before", "guidelines_after"]:
+        rows = average_guidelines(rows, field)
+    return rows
+
+def row_id(position):
+    # Document ID the form scripts give the response at this position
+    return f"row{position}"
+
+def export_writes(forms, master_collection="master_data", only=None, timezone=SPREADSHEET_TIMEZONE):
+    """
+    (collection, document ID, data) of every write, the form collection's
+    document followed by its master_data document. IDs are the ones
+    intialize() in form-scripts/main-control.js gives: the row of the
+    response in its form, and a number running over every form in sheet
+    order in master_data. Importing the same export again overwrites the
+    documents instead of duplicating them. With only, just that form is
+    written, numbered as in the whole export. Timestamps are read as local
+    times in timezone.
+    """
+    writes = []
+    counter = 0
+    for form, rows in forms.items():
+        for position, document in enumerate(code_rows(rows, timezone).to_dict("records")):
+            if only is None or form == only:
+                master = {"form_name": form_key(form)}
+                master.update({field: document.get(field, "N/A") for field in MASTER_COLUMNS if field != "form_name"})
+                writes.append((form, row_id(position), document))
+                writes.append((master_collection, row_id(counter), master))
+            counter += 1
+    return writes
+
+def commit_writes(db, writes, batch_size=BATCH_SIZE, max_workers=MAX_WORKERS):
+    # Commits the writes in batches, several at a time, and returns how many were written
+    if len(writes) == 0:
+        return 0
+    batches = [writes[start:start + batch_size] for start in range(0, len(writes), batch_size)]
+
+    def commit(chunk):
+        batch = db.batch()
+        for collection, key, data in chunk:
+            batch.set(db.collection(collection).document(key), data)
+        batch.commit()
+        return len(chunk)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+        return sum(executor.map(commit, batches))
+
+def ingest_export(db, path, sheet_name=None, dry_run=False, timezone=SPREADSHEET_TIMEZONE):
+    """
+    Writes every response of an export to its form collection and to
+    master_data. Returns the number of documents per collection.
+    """
+    # Every sheet is read so the master_data numbers of one sheet match the whole export
+    writes = export_writes(read_export(path), only=sheet_name, timezone=timezone)
+    if not dry_run:
+        commit_writes(db, writes)
+
+    counts = {}
+    for collection, _, _ in writes:
+        counts[collection] = counts.get(collection, 0) + 1
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes a spreadsheet export of the forms to Firestore")
+    parser.add_argument("path", help="CSV or XLSX export")
+    parser.add_argument("--sheet", help="only this sheet or form of the export")
+    parser.add_argument("--dry-run", action="store_true", help="count the documents without writing them")
+    parser.add_argument("--project", help="project ID, needed with the Firestore emulator")
+    parser.add_argument("--timezone", default=SPREADSHEET_TIMEZONE, help=f"time zone of the spreadsheet, {SPREADSHEET_TIMEZONE} by default")
+    options = parser.parse_args()
+
+    if options.dry_run:
+        db = None
+    elif os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        # The emulator takes any project and needs no key
+        from google.cloud import firestore
+        db = firestore.Client(project=options.project or "eenc-dashboard")
+    else:
+        from google.cloud import firestore
+        from google.oauth2 import service_account
+
+        # Authenticate to Firestore with the JSON account key, like data/feedback_data.py
+        with open(os.getcwd() + "/.streamlit/firestore-key.json") as user_file:
+            key_dict = json.loads(user_file.read())
+        creds = service_account.Credentials.from_service_account_info(key_dict)
+        db = firestore.Client(credentials=creds)
+
+    print(ingest_export(db, options.path, options.sheet, options.dry_run, options.timezone))
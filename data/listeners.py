@@ -0,0 +1,93 @@
+import datetime
+import os
+import threading
+from collections import deque, namedtuple
+
+# Set EENC_LIVE_UPDATES=0 to only pick up new responses on the scheduled refresh
+LIVE_UPDATES = os.environ.get("EENC_LIVE_UPDATES", "1") != "0"
+
+# Number of deltas kept in the log
+MAX_DELTAS = 1000
+
+# One batch of changes pushed for a collection. upserts are the added and modified documents,
+# removals the IDs of deleted ones and documents everything in a form collection after the
+# change, None for master_data, which is updated from the changes alone. The first delta of
+# every subscription has sync set, its upserts are the whole collection.
+Delta = namedtuple("Delta", ["sequence", "collection", "upserts", "removals", "documents", "sync", "received_at"])
+
+class DeltaLog:
+    """
+    Ordered record of the changes pushed by the listeners, numbered so a
+    reader can ask for everything after the last delta it has seen. Only
+    the IDs of the changed documents are kept, so the log stays small
+    however large the collections are.
+    """
+
+    def __init__(self, max_entries=MAX_DELTAS):
+        self.entries = deque(maxlen=max_entries)
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def append(self, collection, upserts, removals, documents, sync=False):
+        # Returns the delta with the documents to apply, the log keeps their IDs
+        with self.lock:
+            self.sequence += 1
+            delta = Delta(self.sequence, collection, upserts, removals, documents, sync, datetime.datetime.now(datetime.timezone.utc))
+            self.entries.append(delta._replace(upserts=[document.id for document in upserts], documents=None))
+            return delta
+
+    def since(self, sequence):
+        with self.lock:
+            return [delta for delta in self.entries if delta.sequence > sequence]
+
+class FirestoreListeners:
+    """
+    Subscribes to master_data and every form collection with on_snapshot and
+    hands each batch of changes to apply, e.g. DataRefresher.apply_delta, so
+    new submissions show up without a reload. Works with anything that
+    calls callback(collection) the way on_snapshot does, including the
+    Firestore emulator (FIRESTORE_EMULATOR_HOST) or a replayed change stream.
+    """
+
+    def __init__(self, db, apply, log=None, master_collection="master_data"):
+        self.db = db
+        self.apply = apply
+        self.master_collection = master_collection
+        self.log = DeltaLog() if log is None else log
+        self.watches = {}
+        self.synced = set()
+
+    def start(self):
+        # Also subscribes collections created since the last call, DataRefresher calls it after every refresh
+        for collection in self.db.collections():
+            self.subscribe(collection.id)
+        return self
+
+    def subscribe(self, collection):
+        if collection not in self.watches:
+            self.watches[collection] = self.db.collection(collection).on_snapshot(self.callback(collection))
+
+    def callback(self, collection):
+        def on_snapshot(documents, changes, read_time):
+            upserts = [change.document for change in changes if change.type.name != "REMOVED"]
+            removals = [change.document.id for change in changes if change.type.name == "REMOVED"]
+
+            # The first snapshot lists every document as added
+            sync = collection not in self.synced
+            self.synced.add(collection)
+
+            # Only form collections are regrouped from their whole document set
+            documents = None if collection == self.master_collection else list(documents)
+            delta = self.log.append(collection, upserts, removals, documents, sync)
+            try:
+                self.apply(delta)
+            except Exception as error:
+                # An exception would end the listener, the scheduled refresh picks the change up instead
+                print("Could not apply the changes to", collection, error)
+        return on_snapshot
+
+    def stop(self):
+        for watch in self.watches.values():
+            watch.unsubscribe()
+        self.watches = {}
+        self.synced = set()
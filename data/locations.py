@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+# Student locations offered on the forms, in the order the pages show them
+LOCATIONS = ['Mix of Areas', 'Rural', 'Suburban', 'Urban']
+
+# Other spellings used by older forms, mapped to the one in LOCATIONS
+LOCATION_ALIASES = {
+    'A Mix of Areas': 'Mix of Areas',
+}
+
+# Columns of the per-location student count table
+STUDENT_COUNT_STATISTICS = {
+    'size': 'Number of instructors',
+    'mean': 'Average student count',
+    'median': 'Median student count',
+    'min': 'Smallest student count',
+    'max': 'Largest student count',
+}
+
+def canonical_locations(column):
+    # Runs at ingest so every page sees a single spelling for each location
+    return column.replace(LOCATION_ALIASES)
+
+def student_count_values(frame, forms, locations):
+    """
+    Number of responses per form, location and student count answer. Adds
+    and subtracts like the aggregate cube's cells, so the statistics can be
+    kept up to date from the changed rows. Unanswered counts are left out.
+    """
+    student_count = frame['Student Count'].astype('float64')
+    answered = student_count.notna()
+    keys = [forms[answered].astype(object), locations[answered].astype(object), student_count[answered].rename('Student Count')]
+    return student_count[answered].groupby(keys).size()
+
+def roll_up(counts, all_value):
+    # Adds the "All" rows to counts indexed by form and location: every form of each location, every location of each form and everything
+    table = counts.reset_index()
+    tables = [table] + [table.assign(**{column: all_value for column in columns}) for columns in [['Student Location'], ['Form Name'], ['Form Name', 'Student Location']]]
+    return pd.concat(tables).groupby(list(counts.index.names), sort=False)[counts.name].sum()
+
+def summarize_student_counts(counts):
+    # Mean, median, min and max of the student counts described by {student count: responses}
+    values = counts.index.to_numpy(dtype='float64')
+    weights = counts.to_numpy()
+    total = weights.sum()
+    cumulative = weights.cumsum()
+    # The middle answer, or the two middle ones for an even number of answers
+    lower = values[np.searchsorted(cumulative, (total + 1) // 2)]
+    upper = values[np.searchsorted(cumulative, total // 2 + 1)]
+    return {'mean': (values * weights).sum() / total, 'median': (lower + upper) / 2, 'min': values[0], 'max': values[-1]}
+
+def student_count_statistics(values, responses, all_value):
+    """
+    Number of responses and student count summary for every form and
+    location, including the "All" rows, indexed by (form, location). Built
+    from student_count_values and the number of responses per form and
+    location, so it never reads the rows.
+    """
+    sizes = roll_up(responses.rename('size'), all_value)
+    counts = roll_up(values.rename('count'), all_value)
+    summaries = {key: summarize_student_counts(group.droplevel([0, 1]).sort_index()) for key, group in counts.groupby(level=[0, 1], sort=False)}
+
+    statistics = pd.DataFrame([summaries.get(key, {}) for key in sizes.index], index=sizes.index, columns=['mean', 'median', 'min', 'max'], dtype='float64')
+    statistics.insert(0, 'size', sizes.to_numpy(dtype='int64'))
+    return statistics.rename(columns=STUDENT_COUNT_STATISTICS)
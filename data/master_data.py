@@ -0,0 +1,138 @@
+import threading
+import uuid
+import pandas as pd
+from data.schema import apply_schema, insert_rows
+
+# Maps each field stored in the master_data collection to its dashboard column name
+MASTER_COLUMNS = {
+    "form_name": "Form Name",
+    "timestamp": "Timestamp",
+    "course_rating": "Course Rating",
+    "guidelines_before": "Guidelines Before",
+    "guidelines_after": "Guidelines After",
+    "improvement_efforts": "Improvement Efforts",
+    "sharing_interest": "Sharing Interest",
+    "instructor_rating": "Instructor Rating",
+    "accessibility_rating": "Accessibility Rating",
+    "navigation_rating": "Navigation Rating",
+    "current_profession": "Current Profession",
+    "student_count": "Student Count",
+    "student_location": "Student Location",
+}
+
+def documents_to_frame(documents):
+    # Create dictionary that will be used to create dataframe
+    data_dict = {column: [] for column in MASTER_COLUMNS.values()}
+    ids = []
+
+    # Iterate through every document and append each value to the dictionary
+    for doc in documents:
+        data = doc.to_dict()
+        ids.append(doc.id)
+        for field, column in MASTER_COLUMNS.items():
+            data_dict[column].append(data[field])
+
+    # Documents are indexed by their ID so later syncs can skip rows that are already loaded
+    frame = pd.DataFrame(data_dict, index=pd.Index(ids, name="Document ID", dtype=object))
+
+    # Converts the values to their declared dtypes once, at ingest
+    return apply_schema(frame)
+
+class MasterDataLoader:
+    """
+    Keeps the master_data rows in memory and only asks Firestore for documents
+    at or after the newest timestamp seen so far (the high-water mark).
+    """
+
+    def __init__(self, db, collection="master_data"):
+        self.db = db
+        self.collection = collection
+        self.frame = documents_to_frame([])
+        self.watermark = None
+        self.version = None
+        # Re-entrant so refresh() can hold it across the read and the merge
+        self.lock = threading.RLock()
+
+    def restore(self, frame, watermark):
+        # Starts from previously loaded rows, e.g. a snapshot, so the next refresh only pulls newer documents
+        with self.lock:
+            self.frame = frame
+            self.watermark = watermark
+            self.version = frame.attrs.get("version")
+
+    def query(self, db, full=False):
+        # Whole collection for a full rebuild, otherwise the documents at or after the high-water mark
+        collection_ref = db.collection(self.collection)
+        if full or self.watermark is None:
+            return collection_ref
+        # Uses >= so responses sharing the watermark timestamp are not lost
+        return collection_ref.where("timestamp", ">=", self.watermark)
+
+    def refresh(self, full=False):
+        with self.lock:
+            return self.merge(list(self.query(self.db, full).stream()), full=full)
+
+    def merge(self, documents, full=False):
+        """
+        Folds the documents read with query() into the frame: all of them on
+        a full rebuild, otherwise only the ones not loaded yet. Lets a loader
+        that reads Firestore another way, e.g. data/async_loader.py, share
+        the watermark and version bookkeeping.
+        """
+        with self.lock:
+            if full or self.watermark is None:
+                self.frame = documents_to_frame(documents)
+                self.watermark = None
+            else:
+                # Drops the responses sharing the watermark timestamp that were already loaded
+                documents = [doc for doc in documents if doc.id not in self.frame.index]
+                if len(documents) > 0:
+                    # Only the new documents are typed, their categories are merged into the loaded ones
+                    self.frame = insert_rows(self.frame, documents_to_frame(documents))
+
+            # Moves the high-water mark to the newest timestamp that was loaded
+            timestamps = [doc.get("timestamp") for doc in documents]
+            if self.watermark is not None:
+                timestamps.append(self.watermark)
+            if len(timestamps) > 0:
+                self.watermark = max(timestamps)
+
+            # Stamps every change with a new version so results derived from the rows can be cached against it
+            if self.version is None or len(documents) > 0 or full:
+                self.version = uuid.uuid4().hex
+            self.frame.attrs["version"] = self.version
+
+            return self.frame
+
+    def apply_changes(self, upserts, removals, sync=False):
+        """
+        Applies documents pushed by a listener without reading Firestore.
+        Returns the new frame with the rows that were taken out and put in,
+        so aggregates can be updated by difference. With sync, upserts is
+        the whole collection, e.g. a listener's first snapshot, and only the
+        documents missing on either side are applied.
+        """
+        with self.lock:
+            if sync:
+                ids = {doc.id for doc in upserts}
+                removals = [id for id in self.frame.index if id not in ids]
+                upserts = [doc for doc in upserts if doc.id not in self.frame.index]
+
+            changed = set(removals) | {doc.id for doc in upserts}
+            removed = self.frame[self.frame.index.isin(changed)]
+            added = documents_to_frame(upserts)
+            if len(removed) == 0 and len(added) == 0:
+                return self.frame, removed, added
+
+            # Only the changed documents are typed, each goes back at the end of its form
+            self.frame = insert_rows(self.frame, added, drop=list(changed))
+
+            timestamps = [doc.get("timestamp") for doc in upserts]
+            if self.watermark is not None:
+                timestamps.append(self.watermark)
+            if len(timestamps) > 0:
+                self.watermark = max(timestamps)
+
+            self.version = uuid.uuid4().hex
+            self.frame.attrs["version"] = self.version
+            return self.frame, removed, added
@@ -0,0 +1,57 @@
+import numpy as np
+from data.aggregates import ALL
+
+def display_name(key):
+    # "online_k-12" is shown as "Online K-12" in the sidebar
+    return key.replace("_", " ").title()
+
+class FormPartitions:
+    """
+    The master data split into one partition per form, with the sidebar
+    options and the display name to form key index, built once per data
+    version. apply_schema keeps the rows grouped by form, so every partition
+    is a slice of the "All" frame instead of a copy.
+    """
+
+    def __init__(self, frame, sizes=None):
+        """
+        sizes, the number of rows of every form key (see
+        AggregateCube.form_sizes), gives the bounds of the partitions of a
+        frame that went through apply_schema without reading its rows.
+        """
+        categories = frame["Form Name"].cat.categories
+        if sizes is not None and sizes.sum() == len(frame):
+            # Rows without a form name have code -1 and come first
+            first = int(sizes.get("N/A", 0))
+            stops = first + np.cumsum([int(sizes.get(key, 0)) for key in categories], dtype="int64")
+        else:
+            codes = frame["Form Name"].cat.codes.to_numpy()
+            if not np.all(codes[:-1] <= codes[1:]):
+                # Only frames that did not go through apply_schema need sorting here
+                order = np.argsort(codes, kind="stable")
+                frame, codes = frame.iloc[order], codes[order]
+            first = np.searchsorted(codes, 0)
+            stops = np.searchsorted(codes, np.arange(len(categories)) + 1)
+
+        self.all = frame
+        self.partitions = {}
+        starts = np.concatenate([[first], stops[:-1]])
+        for key, start, stop in zip(categories, starts, stops):
+            if stop > start:
+                self.partitions[key] = frame.iloc[start:stop]
+
+        self.keys = {display_name(key): key for key in sorted(self.partitions)}
+        self.options = [ALL] + list(self.keys)
+
+    def key(self, name):
+        # Form key of a sidebar option, "All" stays "All"
+        if name == ALL:
+            return ALL
+        return self.keys.get(name, name.lower().replace(" ", "_"))
+
+    def frame(self, key=ALL):
+        if key == ALL:
+            return self.all
+        if key not in self.partitions:
+            return self.all.iloc[0:0]
+        return self.partitions[key]
@@ -0,0 +1,61 @@
+import re
+import pandas as pd
+
+# Options listed on the forms, an answer can pick several of them separated by ", "
+PROFESSIONS = [
+    'Non-Formal Educator',
+    'Conservation/Natural Resources Professional',
+    'College/University Instructor',
+    'Program Director/Administrator',
+    'PreK-12 Classroom Teacher',
+]
+
+# Any answer that mentions being a student, e.g. "Graduate Student" or "college student"
+STUDENT = 'Student'
+
+# Anything typed in that is not one of the options above
+OTHER = 'Other'
+
+PROFESSION_BUCKETS = PROFESSIONS + [STUDENT, OTHER]
+
+OPTIONS_PATTERN = re.compile("|".join(re.escape(option) for option in PROFESSIONS))
+
+def parse_profession(answer):
+    # Returns the buckets a single answer belongs to
+    if not isinstance(answer, str) or answer == "N/A":
+        return set()
+
+    buckets = set(OPTIONS_PATTERN.findall(answer))
+
+    # Whatever is left once the listed options are removed was typed in by hand
+    remainder = [part.strip() for part in OPTIONS_PATTERN.sub(",", answer).split(",")]
+    remainder = [part for part in remainder if part != ""]
+    if any("student" in part.lower() for part in remainder):
+        buckets.add(STUDENT)
+    if any("student" not in part.lower() for part in remainder):
+        buckets.add(OTHER)
+    return buckets
+
+def profession_indicators(answers, known=None):
+    """
+    Indicator matrix with one row per distinct answer and one column per
+    profession bucket. Built from the distinct answers only, so the cost
+    does not grow with the number of responses. Rows of known, a previous
+    matrix, are reused instead of parsing their answers again.
+    """
+    answers = pd.Index(answers).unique()
+    if known is not None:
+        return pd.concat([known, profession_indicators(answers.difference(known.index))])
+    parsed = [parse_profession(answer) for answer in answers]
+    return pd.DataFrame(
+        [[bucket in buckets for bucket in PROFESSION_BUCKETS] for buckets in parsed],
+        index=answers,
+        columns=PROFESSION_BUCKETS,
+        dtype="int64",
+    )
+
+def count_professions(answer_counts, indicators):
+    # Number of responses in every bucket, from the number of responses per distinct answer
+    if len(answer_counts) == 0:
+        return pd.Series(0, index=PROFESSION_BUCKETS, dtype="int64")
+    return indicators.loc[answer_counts.index].mul(answer_counts, axis=0).sum()
@@ -0,0 +1,170 @@
+import datetime
+import os
+import threading
+import time
+import traceback
+from collections import namedtuple
+from data.aggregates import AggregateCube
+from data.feedback_data import documents_feedback, feedback_key
+from data.feedback_index import FeedbackIndex
+from data.partitions import FormPartitions
+from data.search import SearchIndex
+from data.text_analytics import TextAnalytics
+from data.timing import timed
+from data.trends import TrendRollups
+
+# Seconds between scheduled refreshes, 30 minutes by default
+REFRESH_INTERVAL = float(os.environ.get("EENC_REFRESH_SECONDS", 1800))
+
+# Everything the pages read, swapped in as a whole so a rerun never sees master data from one load and aggregates from another
+Dataset = namedtuple("Dataset", ["master", "partitions", "aggregates", "trends", "feedback", "feedback_index", "search", "analytics", "version", "loaded_at"])
+
+def build_dataset(master, feedback, previous=None, search=None):
+    # Reuses the previous partitions, aggregates and trends when the master data did not change
+    version = master.attrs.get("version")
+    if previous is not None and previous.version == version:
+        partitions = previous.partitions
+        aggregates = previous.aggregates
+        trends = previous.trends
+    else:
+        partitions = FormPartitions(master)
+        with timed("Refresh: aggregates"):
+            aggregates = AggregateCube(master)
+        with timed("Refresh: trends"):
+            trends = TrendRollups(master)
+    if previous is not None and previous.feedback is feedback:
+        feedback_index = previous.feedback_index
+    else:
+        with timed("Refresh: feedback index"):
+            feedback_index = FeedbackIndex(feedback)
+    # Only the forms whose comments changed are indexed again
+    if search is None:
+        with timed("Refresh: search index"):
+            search = SearchIndex(feedback) if previous is None else previous.search.updated(feedback)
+    # Only comments that were not there before are analyzed
+    with timed("Refresh: text analytics"):
+        analytics = TextAnalytics(feedback) if previous is None else previous.analytics.updated(feedback)
+    return Dataset(master, partitions, aggregates, trends, feedback, feedback_index, search, analytics, version, datetime.datetime.now(datetime.timezone.utc))
+
+class DataRefresher:
+    """
+    Reloads the data source on a background thread, on a schedule or when
+    woken up by trigger(), and swaps each new dataset in whole. Pages always
+    read the current dataset, so no request waits on a reload
+    (stale-while-revalidate). The duration and error of the last refresh are
+    kept for reporting.
+    """
+
+    def __init__(self, source, interval=REFRESH_INTERVAL):
+        self.source = source
+        self.interval = interval
+        self.dataset = None
+        self.wake = threading.Event()
+        self.full = False
+        self.thread = None
+        self.busy = False
+
+        # Held while a dataset is built and swapped in, so a refresh and a pushed change never overwrite each other
+        self.lock = threading.Lock()
+
+        # Listeners pushing changes into the dataset, when the source has any
+        self.listeners = None
+
+        # Reported on the pages and in the server log
+        self.refreshes = 0
+        self.failures = 0
+        self.last_duration = None
+        self.last_refreshed = None
+        self.last_error = None
+
+    def start(self):
+        # Serves the last snapshot straight away when the source has one, otherwise the first load happens here
+        snapshot = self.source.load_snapshot() if hasattr(self.source, "load_snapshot") else None
+        if snapshot is not None:
+            master, feedback, search = snapshot
+            self.dataset = build_dataset(master, feedback, search=search)
+            self.wake.set()
+        else:
+            self.refresh()
+            if self.dataset is None:
+                raise RuntimeError(f"Could not load the dashboard data: {self.last_error}")
+
+        self.thread = threading.Thread(target=self.run, name="data-refresher", daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            full, self.full = self.full, False
+            self.refresh(full=full)
+
+    def trigger(self, full=False):
+        # Asks for a refresh as soon as the current one is done, without waiting for it
+        self.full = self.full or full
+        self.wake.set()
+
+    def refreshing(self):
+        return self.busy or self.wake.is_set()
+
+    def refresh(self, full=False):
+        started = time.perf_counter()
+        self.busy = True
+        self.lock.acquire()
+        try:
+            with timed("Refresh: master data"):
+                master = self.source.load_master(full=full)
+            with timed("Refresh: feedback"):
+                feedback = self.source.load_feedback()
+            dataset = build_dataset(master, feedback, self.dataset)
+            # Saved next to the feedback snapshot when the source keeps one, which every load rewrites
+            if hasattr(self.source, "save_search"):
+                with timed("Refresh: save search index"):
+                    self.source.save_search(dataset.search)
+        except Exception as error:
+            # Keeps serving the last dataset, the next scheduled refresh tries again
+            self.failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+            self.last_duration = time.perf_counter() - started
+            print("Data refresh failed after", round(self.last_duration, 2), "seconds")
+            traceback.print_exc()
+        else:
+            # A single assignment, so readers get either the old or the new dataset
+            self.dataset = dataset
+            self.refreshes += 1
+            self.last_error = None
+            self.last_duration = time.perf_counter() - started
+            self.last_refreshed = dataset.loaded_at
+            print("Data refreshed in", round(self.last_duration, 2), "seconds, version", dataset.version)
+        finally:
+            self.lock.release()
+            self.busy = False
+
+        # Form collections created since the listeners started are only found by listing the collections again
+        if self.listeners is not None:
+            try:
+                self.listeners.start()
+            except Exception as error:
+                print("Could not subscribe to new collections", error)
+
+    def apply_delta(self, delta):
+        # Folds changes pushed by a listener (see data/listeners.py) into the current dataset without reloading
+        with self.lock, timed("Listener: apply changes"):
+            dataset = self.dataset
+            if delta.collection == self.source.loader.collection:
+                master, removed, added = self.source.loader.apply_changes(delta.upserts, delta.removals, sync=delta.sync)
+                if len(removed) == 0 and len(added) == 0:
+                    return
+                aggregates = dataset.aggregates.updated(master, removed, added)
+                trends = dataset.trends.updated(removed, added)
+                # The partition bounds come from the cube's form counts instead of the rows
+                partitions = FormPartitions(master, aggregates.form_sizes())
+                dataset = dataset._replace(master=master, partitions=partitions, aggregates=aggregates, trends=trends, version=master.attrs["version"])
+            else:
+                # Feedback is regrouped from the documents the listener already holds
+                feedback = dict(dataset.feedback)
+                feedback[feedback_key(delta.collection)] = documents_feedback(delta.documents)
+                dataset = dataset._replace(feedback=feedback, feedback_index=FeedbackIndex(feedback), search=dataset.search.updated(feedback), analytics=dataset.analytics.updated(feedback))
+
+            self.dataset = dataset._replace(loaded_at=datetime.datetime.now(datetime.timezone.utc))
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from data.coding import encode
+from data.locations import canonical_locations
+
+# 1 - 5 answers, stored as nullable small integers
+RATING_COLUMNS = [
+    "Course Rating",
+    "Improvement Efforts",
+    "Sharing Interest",
+    "Instructor Rating",
+    "Accessibility Rating",
+    "Navigation Rating",
+]
+
+# The Don't Waste It form averages several guideline questions, so these can hold fractions
+GUIDELINE_COLUMNS = ["Guidelines Before", "Guidelines After"]
+
+# Codes of the 1 - 5 scales, anything outside them is a typing mistake on the forms
+ANSWER_RANGE = (1, 5)
+
+# Low cardinality text columns that are repeated on every row
+CATEGORY_COLUMNS = ["Form Name", "Current Profession", "Student Location"]
+
+# Declared dtype of every master data column. Student Count is typed in by hand on the
+# forms, so it stays a plain float with NaN for answers that are not numbers.
+MASTER_DTYPES = {
+    "Form Name": "category",
+    "Timestamp": "datetime64[ns, UTC]",
+    "Course Rating": "Int8",
+    "Guidelines Before": "Float32",
+    "Guidelines After": "Float32",
+    "Improvement Efforts": "Int8",
+    "Sharing Interest": "Int8",
+    "Instructor Rating": "Int8",
+    "Accessibility Rating": "Int8",
+    "Navigation Rating": "Int8",
+    "Current Profession": "category",
+    "Student Count": "float32",
+    "Student Location": "category",
+}
+
+# Functions that merge different spellings of the same answer
+CANONICAL_VALUES = {
+    "Student Location": canonical_locations,
+}
+
+def to_numeric_column(column, dtype, valid_range=None):
+    # Answer labels become their code, 'N/A' and any other text a missing value
+    values = column if pd.api.types.is_numeric_dtype(column) else encode(column)
+    if valid_range is not None:
+        # Out of range answers become missing, so one bad cell cannot fail the cast of the whole load
+        values = values.astype("float64")
+        values = values.where(values.between(*valid_range))
+    if dtype.startswith("Int"):
+        values = values.round()
+    return values.astype(dtype)
+
+def to_category_column(column, canonical=None):
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        column = column.astype(object)
+    column = column.where(column != "N/A")
+    if canonical is not None:
+        column = canonical(column)
+    return column.astype("category")
+
+def apply_schema(frame):
+    """
+    Converts the raw Firestore values into the declared dtypes and keeps the
+    rows grouped by form (see data/partitions.py). Safe to call again on an
+    already typed frame, e.g. after appending new rows.
+    """
+    typed = {}
+    for column, dtype in MASTER_DTYPES.items():
+        if dtype == "category":
+            typed[column] = to_category_column(frame[column], CANONICAL_VALUES.get(column))
+        elif dtype.startswith("datetime"):
+            typed[column] = pd.to_datetime(frame[column], errors="coerce", utc=True).astype(dtype)
+        else:
+            valid_range = ANSWER_RANGE if column in RATING_COLUMNS + GUIDELINE_COLUMNS else None
+            typed[column] = to_numeric_column(frame[column], dtype, valid_range)
+
+    typed = pd.DataFrame(typed, index=frame.index)
+
+    # A stable sort, so rows keep their order within each form
+    codes = typed["Form Name"].cat.codes
+    if not codes.is_monotonic_increasing:
+        typed = typed.iloc[codes.argsort(kind="stable")]
+    return typed
+
+def union_categories(first, second):
+    """
+    The two categoricals one after the other. The categories stay sorted
+    like astype("category") sorts them, so the form codes keep the rows
+    grouped by form, and a side without any value does not change their
+    type.
+    """
+    if len(first.categories) == 0 or len(second.categories) == 0:
+        categories = second.categories if len(first.categories) == 0 else first.categories
+        first, second = first.set_categories(categories), second.set_categories(categories)
+    return union_categoricals([first, second], sort_categories=True)
+
+def insert_rows(frame, rows, drop=()):
+    """
+    Typed frame (see apply_schema) without the rows indexed in drop and with
+    the typed rows added at the end of their form, so a few changed
+    documents are merged without typing and sorting every row again.
+    """
+    if len(drop) > 0:
+        frame = frame[~frame.index.isin(drop)]
+        frame = frame.assign(**{column: frame[column].cat.remove_unused_categories() for column in CATEGORY_COLUMNS})
+    if len(rows) == 0:
+        return frame
+
+    merged = {}
+    for column in MASTER_DTYPES:
+        if column in CATEGORY_COLUMNS:
+            merged[column] = union_categories(frame[column].array, rows[column].array)
+        else:
+            merged[column] = pd.concat([frame[column], rows[column]], ignore_index=True).array
+    index = pd.Index(np.concatenate([frame.index.to_numpy(), rows.index.to_numpy()]), name=frame.index.name, dtype=object)
+    merged = pd.DataFrame(merged, index=index)
+
+    # Each new row goes after the rows of its form already loaded, like the stable sort of apply_schema
+    codes = merged["Form Name"].cat.codes.to_numpy()
+    added = codes[len(frame):]
+    order = np.argsort(added, kind="stable")
+    positions = np.searchsorted(codes[:len(frame)], added[order], side="right")
+    return merged.iloc[np.insert(np.arange(len(frame)), positions, len(frame) + order)]
@@ -0,0 +1,183 @@
+import hashlib
+import re
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from data.aggregates import ALL
+from data.feedback_index import answered
+
+# Words are runs of letters and digits, matched without case
+WORD = re.compile(r"\w+")
+
+# A quoted phrase or a single word of a search query
+CLAUSE = re.compile(r'"([^"]*)"|(\S+)')
+
+def tokenize(text):
+    return WORD.findall(text.lower())
+
+def parse_query(query):
+    # Every clause is a list of words that must appear next to each other, a word like "e-mail" is a phrase too
+    clauses = []
+    for phrase, word in CLAUSE.findall(query):
+        tokens = tokenize(phrase or word)
+        if len(tokens) > 0:
+            clauses.append(tokens)
+    return clauses
+
+def fingerprint(form_feedback):
+    # Changes whenever one of the form's answered comments does, so unchanged forms are not indexed again
+    digest = hashlib.sha1()
+    for feedback_type, values in form_feedback.items():
+        digest.update(feedback_type.encode() + b"\0")
+        for text in answered(values):
+            digest.update(text.encode() + b"\0")
+    return digest.hexdigest()
+
+class Segment:
+    """
+    Inverted index over the answered comments of one form. Every word
+    occurrence is a (comment, position) posting, sorted by word, so the
+    postings of a word are the rows offsets[code] to offsets[code + 1].
+    """
+
+    def __init__(self, fingerprint, texts, types, type_names, vocabulary, offsets, comments, positions):
+        self.fingerprint = fingerprint
+        self.texts = texts
+        self.types = types
+        self.type_names = type_names
+        self.vocabulary = {term: code for code, term in enumerate(vocabulary)}
+        self.offsets = offsets
+        self.comments = comments
+        self.positions = positions
+        # Larger than any position, so a (comment, position) pair packs into one integer
+        self.stride = int(positions.max()) + 1 if len(positions) > 0 else 1
+
+    @classmethod
+    def build(cls, form_feedback, digest=None):
+        texts, types, terms, comments, positions = [], [], [], [], []
+        type_names = list(form_feedback)
+        for code, feedback_type in enumerate(type_names):
+            for text in answered(form_feedback[feedback_type]):
+                tokens = tokenize(text)
+                terms.extend(tokens)
+                comments.extend([len(texts)] * len(tokens))
+                positions.extend(range(len(tokens)))
+                texts.append(text)
+                types.append(code)
+
+        codes, vocabulary = pd.factorize(pd.Series(terms, dtype=object), sort=True)
+        # Postings were added in comment and position order, a stable sort keeps it within every word
+        order = np.argsort(codes, kind="stable")
+        offsets = np.zeros(len(vocabulary) + 1, dtype="int64")
+        np.cumsum(np.bincount(codes, minlength=len(vocabulary)), out=offsets[1:])
+        return cls(
+            fingerprint(form_feedback) if digest is None else digest,
+            pa.array(texts, pa.string()),
+            np.array(types, dtype="int8"),
+            type_names,
+            list(vocabulary),
+            offsets,
+            np.array(comments, dtype="int32")[order],
+            np.array(positions, dtype="int32")[order],
+        )
+
+    def postings(self, term):
+        code = self.vocabulary.get(term)
+        if code is None:
+            return slice(0, 0)
+        return slice(self.offsets[code], self.offsets[code + 1])
+
+    def match(self, tokens):
+        # Comments containing the words in this order, sorted
+        rows = self.postings(tokens[0])
+        if len(tokens) == 1:
+            return np.unique(self.comments[rows])
+
+        keys = self.comments[rows].astype("int64") * self.stride + self.positions[rows]
+        for offset, term in enumerate(tokens[1:], 1):
+            if len(keys) == 0:
+                break
+            rows = self.postings(term)
+            # Words too close to the start of their comment cannot follow the first one
+            later = self.positions[rows] >= offset
+            following = self.comments[rows][later].astype("int64") * self.stride + self.positions[rows][later] - offset
+            keys = np.intersect1d(keys, following, assume_unique=True)
+        return np.unique(keys // self.stride).astype("int32")
+
+    def search(self, clauses, feedback_type=None):
+        if feedback_type is not None and feedback_type not in self.type_names:
+            return np.zeros(0, dtype="int32")
+
+        matches = None
+        for tokens in clauses:
+            found = self.match(tokens)
+            matches = found if matches is None else np.intersect1d(matches, found, assume_unique=True)
+            if len(matches) == 0:
+                break
+        if matches is None:
+            matches = np.arange(len(self.texts), dtype="int32")
+
+        if feedback_type is not None:
+            matches = matches[self.types[matches] == self.type_names.index(feedback_type)]
+        return matches
+
+class SearchResults:
+    """
+    Matching comments of every searched form, in form order. Only the texts
+    of the page being shown are taken out of the index.
+    """
+
+    def __init__(self, hits):
+        self.hits = hits
+        self.count = sum(len(comments) for _, comments in hits)
+
+    def page(self, start, stop):
+        texts = []
+        for segment, comments in self.hits:
+            if start < len(comments) and stop > 0:
+                texts.extend(segment.texts.take(comments[max(start, 0):stop]).to_pylist())
+            start -= len(comments)
+            stop -= len(comments)
+        return texts
+
+class SearchIndex:
+    """
+    Keyword and phrase search over every *_feedback answer of every form,
+    one Segment per form. updated() indexes only the forms whose comments
+    changed, so a refresh or a pushed change does not tokenize everything
+    again.
+    """
+
+    def __init__(self, feedback=None, segments=None):
+        if segments is None:
+            segments = {form: Segment.build(form_feedback) for form, form_feedback in (feedback or {}).items()}
+        self.segments = segments
+
+    def updated(self, feedback):
+        segments = {}
+        for form, form_feedback in feedback.items():
+            digest = fingerprint(form_feedback)
+            previous = self.segments.get(form)
+            if previous is not None and previous.fingerprint == digest:
+                segments[form] = previous
+            else:
+                segments[form] = Segment.build(form_feedback, digest)
+        return SearchIndex(segments=segments)
+
+    def search(self, query, form=ALL, feedback_type=None):
+        """
+        Comments containing every word and quoted phrase of the query,
+        limited to one form unless form is "All" and to one feedback type
+        when one is given.
+        """
+        clauses = parse_query(query)
+        forms = sorted(self.segments) if form == ALL else [form]
+        hits = []
+        for name in forms:
+            segment = self.segments.get(name)
+            if segment is None:
+                continue
+            comments = segment.search(clauses, feedback_type)
+            if len(comments) > 0:
+                hits.append((segment, comments))
+        return SearchResults(hits)
@@ -0,0 +1,295 @@
+import datetime
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from data.schema import MASTER_DTYPES, apply_schema
+from data.search import SearchIndex, Segment
+
+# Directory the snapshots are kept in, one Arrow file per dataset
+SNAPSHOT_DIR = os.environ.get("EENC_SNAPSHOT_DIR", ".snapshot")
+
+def encode_watermark(watermark):
+    if isinstance(watermark, datetime.datetime):
+        return {"type": "datetime", "value": watermark.isoformat()}
+    return {"type": "str", "value": None if watermark is None else str(watermark)}
+
+def decode_watermark(encoded):
+    if encoded["type"] == "datetime":
+        return datetime.datetime.fromisoformat(encoded["value"])
+    return encoded["value"]
+
+class SnapshotStore:
+    """
+    Keeps the last loaded master and feedback data on disk as uncompressed
+    Arrow IPC files, so a new server process can memory-map them and serve
+    straight away instead of scanning Firestore. The version stamp and
+    high-water mark are stored in the file's schema metadata.
+    """
+
+    def __init__(self, directory=SNAPSHOT_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.saved_version = None
+        # Stamp of the feedback snapshot last written or read, the search index is only used with the feedback it was built from
+        self.feedback_saved_at = None
+
+    def path(self, name):
+        return os.path.join(self.directory, name + ".arrow")
+
+    def write(self, name, table, metadata):
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"eenc": json.dumps(metadata).encode()})
+
+        # Writes next to the old file and swaps it in, so readers never see a partial snapshot
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            temporary = self.path(name) + ".tmp"
+            with pa.OSFile(temporary, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(temporary, self.path(name))
+
+    def read(self, name):
+        if not os.path.exists(self.path(name)):
+            return None
+        try:
+            # The table reads straight from the mapped file, so the map stays open for as long as it is used
+            source = pa.memory_map(self.path(name), "r")
+            table = pa.ipc.open_file(source).read_all()
+            metadata = json.loads(table.schema.metadata[b"eenc"])
+        except (pa.ArrowInvalid, KeyError, ValueError, OSError) as error:
+            print("Ignoring unreadable snapshot", self.path(name), error)
+            return None
+        return table, metadata
+
+    def save_master(self, frame, watermark):
+        # Nothing to write when this version is already on disk
+        if frame.attrs.get("version") == self.saved_version:
+            return
+
+        metadata = {
+            "version": frame.attrs.get("version"),
+            "watermark": encode_watermark(watermark),
+            "saved_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        # Stored in the typed layout, so a restart wraps the mapped buffers instead of typing the rows again
+        table, metadata["layout"] = frame_to_table(frame)
+        metadata["schema"] = MASTER_DTYPES
+        self.write("master_data", table, metadata)
+        self.saved_version = metadata["version"]
+
+    def load_master(self):
+        # Returns the frame and its high-water mark, or None when there is no usable snapshot
+        snapshot = self.read("master_data")
+        if snapshot is None:
+            return None
+        table, metadata = snapshot
+
+        if metadata.get("schema") == MASTER_DTYPES:
+            frame = frame_from_table(table, metadata["layout"])
+        else:
+            # Written before the schema last changed, so the rows are typed again
+            frame = apply_schema(table.to_pandas())
+        frame.attrs["version"] = metadata["version"]
+        self.saved_version = metadata["version"]
+        return frame, decode_watermark(metadata["watermark"])
+
+    def save_feedback(self, feedback):
+        metadata = {
+            "forms": list(feedback),
+            "saved_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        self.write("feedback_data", feedback_to_table(feedback), metadata)
+        self.feedback_saved_at = metadata["saved_at"]
+
+    def load_feedback(self):
+        snapshot = self.read("feedback_data")
+        if snapshot is None:
+            return None
+        table, metadata = snapshot
+        self.feedback_saved_at = metadata.get("saved_at")
+        return feedback_from_table(table, metadata["forms"])
+
+    def save_search(self, index):
+        # Written after the feedback it indexes, the three files share its stamp
+        metadata = {
+            "feedback_saved_at": self.feedback_saved_at,
+            "forms": [segment_metadata(form, segment) for form, segment in index.segments.items()],
+        }
+        for name, table in search_to_tables(index).items():
+            self.write(name, table, metadata)
+
+    def load_search(self):
+        # The search index saved with the last feedback read, or None when it is missing or belongs to other feedback
+        tables = {}
+        for name in SEARCH_TABLES:
+            snapshot = self.read(name)
+            if snapshot is None:
+                return None
+            table, metadata = snapshot
+            if self.feedback_saved_at is None or metadata.get("feedback_saved_at") != self.feedback_saved_at:
+                return None
+            tables[name] = table
+        return search_from_tables(tables, metadata["forms"])
+
+def feedback_to_table(feedback):
+    # Flattens the nested {form: {feedback type: [comments]}} dictionary into one long table
+    forms, types, comments = [], [], []
+    for form, feedback_documents in feedback.items():
+        for feedback_type, values in feedback_documents.items():
+            forms.extend([form] * len(values))
+            types.extend([feedback_type] * len(values))
+            comments.extend(["N/A" if value is None else str(value) for value in values])
+
+    return pa.table({
+        "form": pa.array(forms, pa.string()).dictionary_encode(),
+        "feedback_type": pa.array(types, pa.string()).dictionary_encode(),
+        "comment": pa.array(comments, pa.string()),
+    })
+
+def feedback_from_table(table, forms=()):
+    # Forms without any feedback questions have no rows, so they can be passed in separately
+    feedback = {form: {} for form in forms}
+    columns = zip(
+        table.column("form").to_pylist(),
+        table.column("feedback_type").to_pylist(),
+        table.column("comment").to_pylist(),
+    )
+    for form, feedback_type, comment in columns:
+        feedback.setdefault(form, {}).setdefault(feedback_type, []).append(comment)
+    return feedback
+
+# Files the search index is kept in, comments, the words of every form and their postings
+SEARCH_TABLES = ["search_comments", "search_terms", "search_postings"]
+
+def segment_metadata(form, segment):
+    return {
+        "form": form,
+        "fingerprint": segment.fingerprint,
+        "types": segment.type_names,
+        "comments": len(segment.texts),
+        "terms": len(segment.vocabulary),
+    }
+
+def search_to_tables(index):
+    # Every form's segment one after the other, the row counts of each are kept in the metadata
+    comments, types, terms, counts, posting_comments, positions = [], [], [], [], [], []
+    for segment in index.segments.values():
+        comments.append(segment.texts)
+        types.append(segment.types)
+        terms.extend(segment.vocabulary)
+        counts.append(np.diff(segment.offsets))
+        posting_comments.append(segment.comments)
+        positions.append(segment.positions)
+
+    def concatenate(arrays, dtype):
+        return np.concatenate(arrays).astype(dtype) if len(arrays) > 0 else np.zeros(0, dtype=dtype)
+
+    return {
+        "search_comments": pa.table({
+            "type": pa.array(concatenate(types, "int8")),
+            "comment": pa.concat_arrays(comments) if len(comments) > 0 else pa.array([], pa.string()),
+        }),
+        "search_terms": pa.table({
+            "term": pa.array(terms, pa.string()),
+            "count": pa.array(concatenate(counts, "int64")),
+        }),
+        "search_postings": pa.table({
+            "comment": pa.array(concatenate(posting_comments, "int32")),
+            "position": pa.array(concatenate(positions, "int32")),
+        }),
+    }
+
+def mapped_column(table, name):
+    # A table written in one piece has one chunk per column, which is used as it is instead of being copied into a new array
+    column = table.column(name)
+    return column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+
+def frame_to_table(frame):
+    """
+    The typed master data as plain buffers: values, a byte mask for the
+    nullable columns and codes for the categorical ones, so workers can wrap
+    them into the same frame without copying (see frame_from_table). Used
+    for the master data snapshot and by the data host (see data/host.py).
+    """
+    arrays = {frame.index.name or "index": pa.array(frame.index.astype(str).tolist(), pa.large_string())}
+    layout = []
+    for name, column in frame.items():
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            arrays[name] = pa.array(column.array.codes)
+            layout.append({"name": name, "kind": "category", "categories": column.cat.categories.tolist()})
+        elif isinstance(column.dtype, pd.DatetimeTZDtype):
+            arrays[name] = pa.array(column.array.asi8)
+            layout.append({"name": name, "kind": "datetime", "unit": column.dtype.unit, "tz": str(column.dtype.tz)})
+        elif isinstance(column.array, (pd.arrays.IntegerArray, pd.arrays.FloatingArray)):
+            arrays[name] = pa.array(column.to_numpy(dtype=column.dtype.numpy_dtype, na_value=0))
+            arrays[name + ":mask"] = pa.array(column.isna().to_numpy().view("uint8"))
+            layout.append({"name": name, "kind": "masked", "dtype": str(column.dtype)})
+        else:
+            # NaN stays a value rather than becoming an Arrow null
+            arrays[name] = pa.array(column.to_numpy())
+            layout.append({"name": name, "kind": "plain"})
+    return pa.table(arrays), {"index": frame.index.name, "columns": layout}
+
+def buffer_view(table, name):
+    # Read-only numpy view of a memory-mapped Arrow column without nulls
+    chunk = mapped_column(table, name)
+    dtype = chunk.type.to_pandas_dtype()
+    if len(chunk) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.frombuffer(chunk.buffers()[1], dtype=dtype, count=len(chunk), offset=chunk.offset * np.dtype(dtype).itemsize)
+
+def frame_from_table(table, layout):
+    # The frame frame_to_table was given, with every column reading from the table's buffers
+    columns = {}
+    for field in layout["columns"]:
+        name = field["name"]
+        values = buffer_view(table, name)
+        if field["kind"] == "category":
+            columns[name] = pd.Categorical.from_codes(values, dtype=pd.CategoricalDtype(field["categories"]), validate=False)
+        elif field["kind"] == "datetime":
+            # _simple_new is the only constructor that wraps the values instead of copying them
+            columns[name] = pd.arrays.DatetimeArray._simple_new(values.view(f"M8[{field['unit']}]"), dtype=pd.DatetimeTZDtype(field["unit"], field["tz"]))
+        elif field["kind"] == "masked":
+            mask = buffer_view(table, name + ":mask").view(bool)
+            array_type = pd.arrays.IntegerArray if field["dtype"].startswith("Int") else pd.arrays.FloatingArray
+            columns[name] = array_type(values, mask)
+        else:
+            columns[name] = values
+
+    index = pd.Index(pd.array(mapped_column(table, layout["index"] or "index"), dtype="str"), name=layout["index"])
+    return pd.DataFrame(columns, index=index, copy=False)
+
+def search_from_tables(tables, forms):
+    # The comments and postings stay in the memory-mapped file, only the words are read into a dictionary
+    comments = tables["search_comments"]
+    terms = tables["search_terms"]
+    postings = tables["search_postings"]
+    types = mapped_column(comments, "type").to_numpy(zero_copy_only=False)
+    texts = mapped_column(comments, "comment")
+    counts = mapped_column(terms, "count").to_numpy(zero_copy_only=False)
+    posting_comments = mapped_column(postings, "comment").to_numpy(zero_copy_only=False)
+    positions = mapped_column(postings, "position").to_numpy(zero_copy_only=False)
+
+    segments = {}
+    comment_start = term_start = posting_start = 0
+    for form in forms:
+        comment_stop = comment_start + form["comments"]
+        term_stop = term_start + form["terms"]
+        offsets = np.zeros(form["terms"] + 1, dtype="int64")
+        np.cumsum(counts[term_start:term_stop], out=offsets[1:])
+        posting_stop = posting_start + int(offsets[-1])
+        segments[form["form"]] = Segment(
+            form["fingerprint"],
+            texts.slice(comment_start, form["comments"]),
+            types[comment_start:comment_stop],
+            form["types"],
+            terms.column("term").slice(term_start, form["terms"]).to_pylist(),
+            offsets,
+            posting_comments[posting_start:posting_stop],
+            positions[posting_start:posting_stop],
+        )
+        comment_start, term_start, posting_start = comment_stop, term_stop, posting_stop
+    return SearchIndex(segments=segments)
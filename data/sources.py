@@ -0,0 +1,253 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from google.cloud import firestore
+from google.oauth2 import service_account
+from data.async_loader import AsyncFirestoreLoader, MAX_CONCURRENCY, PAGE_SIZE
+from data.master_data import MasterDataLoader, MASTER_COLUMNS
+from data.feedback_data import load_feedback_data
+from data.schema import apply_schema
+from data.snapshot import SnapshotStore, feedback_from_table
+from data.trends import TIMEZONE
+
+# Every data source has the same two methods:
+#   load_master()   returns the typed master data frame (see data/schema.py) with attrs["version"] set
+#   load_feedback() returns {form name: {feedback type: [comments]}}
+
+# Timestamp format of a Google Sheets export
+TIMESTAMP_FORMAT = "%m/%d/%Y %H:%M:%S"
+
+# Time zone of the spreadsheet the forms write to, its timestamps are local wall-clock times
+SPREADSHEET_TIMEZONE = TIMEZONE
+
+def utc_timestamps(timestamps, timezone=SPREADSHEET_TIMEZONE):
+    # Naive local times, e.g. the parsed Timestamp column of an export, as the UTC instants the form
+    # scripts write. The hour repeated when daylight saving time ends is read as standard time.
+    local = timestamps.dt.tz_localize(timezone, ambiguous=np.zeros(len(timestamps), dtype=bool), nonexistent="shift_forward")
+    return local.dt.tz_convert("UTC")
+
+def form_key(name):
+    # Same form names as the ones written to master_data
+    return name.lower().replace(" ", "_")
+
+def file_version(*paths):
+    # Changes whenever one of the files is rewritten, so cached results stay valid between reloads
+    stamp = hashlib.sha1()
+    for path in paths:
+        if path is not None and os.path.exists(path):
+            stat = os.stat(path)
+            stamp.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+    return stamp.hexdigest()
+
+class FirestoreSource:
+    """
+    Reads the live Firestore collections. Master data is synced incrementally
+    and every load is written to the snapshot store when one is given.
+    """
+
+    def __init__(self, db, snapshots=None):
+        self.db = db
+        self.loader = MasterDataLoader(db)
+        self.snapshots = snapshots
+
+    def load_master(self, full=False):
+        frame = self.loader.refresh(full=full)
+        if self.snapshots is not None:
+            self.snapshots.save_master(frame, self.loader.watermark)
+        return frame
+
+    def load_feedback(self):
+        feedback = load_feedback_data(self.db)
+        if self.snapshots is not None:
+            self.snapshots.save_feedback(feedback)
+        return feedback
+
+    def save_search(self, index):
+        if self.snapshots is not None:
+            self.snapshots.save_search(index)
+
+    def restore(self, frame, watermark):
+        self.loader.restore(frame, watermark)
+
+    def load_snapshot(self):
+        # Last saved master data, feedback and feedback search index, or None when the data is missing
+        if self.snapshots is None:
+            return None
+        master = self.snapshots.load_master()
+        feedback = self.snapshots.load_feedback()
+        if master is None or feedback is None:
+            return None
+
+        # Later refreshes only pull the responses newer than the snapshot
+        self.restore(*master)
+        # None when the index was not saved with this feedback, it is then built again
+        return master[0], feedback, self.snapshots.load_search()
+
+class AsyncFirestoreSource(FirestoreSource):
+    """
+    Reads Firestore with the async client instead, paging through
+    master_data and every form collection at the same time (see
+    data/async_loader.py). The synchronous client is still used by the
+    listeners.
+    """
+
+    def __init__(self, db, async_db, snapshots=None, page_size=PAGE_SIZE, max_concurrency=MAX_CONCURRENCY):
+        super().__init__(db, snapshots)
+        self.reader = AsyncFirestoreLoader(async_db, self.loader, page_size, max_concurrency)
+        self.feedback = None
+
+    def load_master(self, full=False):
+        # The feedback is read together with the master data and handed out by the next load_feedback()
+        frame, self.feedback = self.reader.load(full=full)
+        if self.snapshots is not None:
+            self.snapshots.save_master(frame, self.loader.watermark)
+        return frame
+
+    def load_feedback(self):
+        if self.feedback is None:
+            self.load_master()
+        feedback, self.feedback = self.feedback, None
+        if self.snapshots is not None:
+            self.snapshots.save_feedback(feedback)
+        return feedback
+
+class CsvSource:
+    """
+    Reads a spreadsheet export shaped like data/data.csv in typed chunks, so
+    large exports never hold the whole file as text at once. Answers are
+    coded to 1 - 5 the same way the form scripts do before writing to Firestore.
+    """
+
+    def __init__(self, path="data/data.csv", feedback_path=None, chunksize=50000, timestamp_format=TIMESTAMP_FORMAT, timezone=SPREADSHEET_TIMEZONE):
+        self.path = path
+        self.feedback_path = feedback_path or path
+        self.chunksize = chunksize
+        self.timestamp_format = timestamp_format
+        self.timezone = timezone
+
+    def code_chunk(self, chunk):
+        chunk["Form Name"] = chunk["Form Name"].map(form_key, na_action="ignore")
+        timestamps = pd.to_datetime(chunk["Timestamp"], format=self.timestamp_format, errors="coerce")
+        chunk["Timestamp"] = utc_timestamps(timestamps, self.timezone)
+        # The schema codes the answer labels (see data/coding.py)
+        return apply_schema(chunk)
+
+    def load_master(self, full=False):
+        columns = list(MASTER_COLUMNS.values())
+        chunks = []
+        reader = pd.read_csv(self.path, usecols=columns, dtype=str, keep_default_na=False, na_values=["", "N/A"], chunksize=self.chunksize)
+        for chunk in reader:
+            chunks.append(self.code_chunk(chunk))
+
+        # Re-applies the schema so the categories of every chunk are merged
+        frame = apply_schema(pd.concat(chunks)) if len(chunks) > 0 else apply_schema(pd.DataFrame(columns=columns))
+        frame.index = pd.Index([f"row{i}" for i in range(len(frame))], name="Document ID", dtype=object)
+        frame.attrs["version"] = file_version(self.path)
+        return frame
+
+    def load_feedback(self):
+        # Uses every column with "feedback" in its name, grouped by form
+        header = pd.read_csv(self.feedback_path, nrows=0).columns
+        feedback_columns = [column for column in header if "feedback" in column.lower()]
+        feedback = {}
+        reader = pd.read_csv(self.feedback_path, usecols=["Form Name"] + feedback_columns, dtype=str, keep_default_na=False, chunksize=self.chunksize)
+        for chunk in reader:
+            for form, rows in chunk.groupby("Form Name", sort=False):
+                feedback_documents = feedback.setdefault(form_key(form), {})
+                for column in feedback_columns:
+                    values = rows[column].replace("", "N/A").tolist()
+                    feedback_documents.setdefault(form_key(column), []).extend(values)
+        return feedback
+
+class ParquetSource:
+    """
+    Reads master data from a Parquet file written with DataFrame.to_parquet
+    and, optionally, feedback from a long form, feedback_type, comment table.
+    """
+
+    def __init__(self, path, feedback_path=None):
+        self.path = path
+        self.feedback_path = feedback_path
+
+    def load_master(self, full=False):
+        frame = apply_schema(pq.read_table(self.path, memory_map=True).to_pandas())
+        frame.attrs["version"] = file_version(self.path)
+        return frame
+
+    def load_feedback(self):
+        if self.feedback_path is None:
+            return {}
+        return feedback_from_table(pq.read_table(self.feedback_path, memory_map=True))
+
+class SnapshotSource:
+    """
+    Serves the last snapshot written by a Firestore-backed server, without
+    ever contacting Firestore.
+    """
+
+    def __init__(self, path=None):
+        self.snapshots = SnapshotStore(path) if path else SnapshotStore()
+
+    def load_master(self, full=False):
+        snapshot = self.snapshots.load_master()
+        if snapshot is None:
+            raise FileNotFoundError(f"No master data snapshot in {self.snapshots.directory}")
+        return snapshot[0]
+
+    def load_feedback(self):
+        return self.snapshots.load_feedback() or {}
+
+# Sources that can be picked by name in the configuration
+SOURCES = {
+    "csv": CsvSource,
+    "parquet": ParquetSource,
+    "snapshot": SnapshotSource,
+}
+
+def create_source(source_type, **options):
+    if source_type not in SOURCES:
+        raise ValueError(f"Unknown data source '{source_type}', expected one of {', '.join(['firestore', 'firestore-async'] + list(SOURCES))}")
+    return SOURCES[source_type](**options)
+
+def firestore_database(key_data, asynchronous=False):
+    # Client authenticated with the JSON account key
+    creds = service_account.Credentials.from_service_account_info(key_data)
+    if asynchronous:
+        return firestore.AsyncClient(credentials=creds)
+    return firestore.Client(credentials=creds)
+
+def configured_source(secrets, database=firestore_database, hosted=True):
+    """
+    The data source configured with a [data_source] table in the secrets,
+    e.g. type = "csv" and path = "data/data.csv", or with the
+    EENC_DATA_SOURCE and EENC_DATA_PATH environment variables. Firestore,
+    the default, is read with the JSON account key stored as textkey
+    through database(key_data). Used by Overall.py and by the data host,
+    which cannot read from another host (hosted=False).
+    """
+    try:
+        options = dict(secrets["data_source"])
+    except (KeyError, FileNotFoundError):
+        options = {}
+    source_type = os.environ.get("EENC_DATA_SOURCE", options.pop("type", "firestore"))
+    if "EENC_DATA_PATH" in os.environ:
+        options["path"] = os.environ["EENC_DATA_PATH"]
+
+    # Workers of a multi-process deployment read what the data host publishes (see data/host.py)
+    if source_type == "host":
+        if not hosted:
+            raise ValueError("The data host needs a data source to load from, not another host")
+        from data.host import HostedData
+        return HostedData(**options)
+    if source_type not in ["firestore", "firestore-async"]:
+        return create_source(source_type, **options)
+
+    key_data = json.loads(secrets["textkey"])
+    # Pages through every collection concurrently, page_size and max_concurrency can be set in [data_source]
+    if source_type == "firestore-async":
+        # The async client is never shared, it belongs to the event loop of the source that uses it
+        return AsyncFirestoreSource(database(key_data), firestore_database(key_data, asynchronous=True), SnapshotStore(), **options)
+    return FirestoreSource(database(key_data), SnapshotStore())
@@ -0,0 +1,185 @@
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from data.aggregates import ALL
+from data.feedback_index import answered
+from data.search import fingerprint, tokenize
+
+# Weight of words that say how a participant felt, from -3 to 3
+LEXICON = {
+    # Positive
+    "amazing": 3, "excellent": 3, "fantastic": 3, "outstanding": 3, "wonderful": 3, "loved": 3, "love": 3, "awesome": 3,
+    "great": 2, "enjoyed": 2, "enjoy": 2, "enjoyable": 2, "engaging": 2, "helpful": 2, "useful": 2, "valuable": 2,
+    "informative": 2, "inspiring": 2, "fun": 2, "thank": 2, "thanks": 2, "knowledgeable": 2, "beneficial": 2,
+    "good": 1, "clear": 1, "interesting": 1, "practical": 1, "organized": 1, "easy": 1, "relevant": 1, "nice": 1,
+    "like": 1, "liked": 1, "appreciate": 1, "appreciated": 1, "accessible": 1, "flexible": 1, "friendly": 1,
+    "interactive": 1, "well": 1, "better": 1, "best": 2, "recommend": 2, "thorough": 1, "applicable": 1,
+    # Negative
+    "terrible": -3, "awful": -3, "horrible": -3, "useless": -3, "hated": -3, "hate": -3, "waste": -3,
+    "boring": -2, "confusing": -2, "frustrating": -2, "difficult": -2, "unclear": -2, "disorganized": -2,
+    "outdated": -2, "irrelevant": -2, "poor": -2, "broken": -2, "annoying": -2, "overwhelming": -2,
+    "long": -1, "slow": -1, "rushed": -1, "hard": -1, "repetitive": -1, "tedious": -1, "dull": -1, "lacking": -1,
+    "missing": -1, "problem": -1, "problems": -1, "issue": -1, "issues": -1, "bad": -2, "worse": -2, "worst": -3,
+    "disappointed": -2, "disappointing": -2, "tiring": -1, "lengthy": -1, "vague": -1, "glitchy": -2,
+}
+
+# Words that turn the sentiment of the word after them around, e.g. "not helpful"
+NEGATIONS = {"not", "no", "never", "nothing", "hardly", "barely", "isn", "wasn", "didn", "don", "doesn", "aren", "weren", "t"}
+
+# Words left out of the keywords
+STOPWORDS = {
+    "a", "about", "all", "also", "an", "and", "any", "are", "as", "at", "be", "because", "been", "but", "by", "can",
+    "could", "did", "do", "does", "for", "from", "had", "has", "have", "how", "i", "if", "in", "into", "is", "it",
+    "its", "just", "me", "more", "most", "my", "of", "on", "one", "or", "other", "our", "out", "so", "some", "than",
+    "that", "the", "their", "them", "there", "these", "they", "this", "those", "to", "too", "up", "us", "very", "was",
+    "we", "were", "what", "when", "which", "who", "will", "with", "would", "you", "your", "n", "really",
+    "much", "many", "lot", "think", "felt", "feel", "course", "workshop", "none", "na",
+}
+
+# Normalizes a sum of word weights to between -1 and 1, as VADER does
+ALPHA = 15
+
+# Scores above THRESHOLD are positive and below -THRESHOLD negative
+THRESHOLD = 0.05
+
+# Keywords shown for every question
+KEYWORDS = 5
+
+# What the pages show for the comments of one form and feedback question
+Summary = namedtuple("Summary", ["comments", "positive", "neutral", "negative", "sentiment", "keywords"])
+
+# Sentiment counts and summed term frequencies of the answers to one question
+QuestionStatistics = namedtuple("QuestionStatistics", ["comments", "positive", "negative", "score", "tf"])
+
+# Everything kept for a form until its comments change
+FormAnalysis = namedtuple("FormAnalysis", ["fingerprint", "results", "questions", "frequency", "comments"])
+
+def analyze(texts):
+    """
+    Sentiment score, from -1 to 1, and keyword candidates of every comment,
+    scored together as one array of words.
+    """
+    tokens = [tokenize(text) for text in texts]
+    lengths = np.array([len(words) for words in tokens], dtype="int64")
+    comments = np.repeat(np.arange(len(texts)), lengths)
+    # Words are looked up once per distinct word rather than once per occurrence
+    codes, vocabulary = pd.factorize(np.array([word for words in tokens for word in words], dtype=object))
+    vocabulary = pd.Series(vocabulary, dtype=object)
+
+    weights = vocabulary.map(LEXICON).fillna(0).to_numpy(dtype="float64")[codes]
+    # A negation flips the word right after it in the same comment
+    negation = vocabulary.isin(NEGATIONS).to_numpy()
+    negated = np.zeros(len(codes), dtype=bool)
+    negated[1:] = negation[codes[:-1]] & (comments[1:] == comments[:-1])
+    weights = np.where(negated, -weights, weights)
+
+    totals = np.bincount(comments, weights=weights, minlength=len(texts))
+    scores = totals / np.sqrt(totals ** 2 + ALPHA)
+
+    keywords = set(vocabulary[~vocabulary.isin(STOPWORDS) & ~negation & (vocabulary.str.len() > 2) & ~vocabulary.str.isdigit()])
+    return {
+        text: (float(score), tuple(word for word in words if word in keywords))
+        for text, score, words in zip(texts, scores, tokens)
+    }
+
+def question_statistics(comments, results):
+    scores = np.array([results[text][0] for text in comments], dtype="float64")
+    keywords = [results[text][1] for text in comments]
+    lengths = np.array([len(words) for words in keywords], dtype="int64")
+    # Term frequency, every comment's keywords add up to 1
+    tf = pd.Series(np.repeat(1 / np.maximum(lengths, 1), lengths))
+    tf = tf.groupby(np.array([word for words in keywords for word in words], dtype=object)).sum() if len(tf) > 0 else pd.Series(dtype="float64")
+    return QuestionStatistics(len(comments), int((scores > THRESHOLD).sum()), int((scores < -THRESHOLD).sum()), float(scores.sum()), tf)
+
+def analyze_form(form_feedback, digest, previous=None):
+    """
+    Sentiment and keywords of one form's answers. Comments the previous
+    analysis of the form already scored are not analyzed again.
+    """
+    questions = {feedback_type: answered(values) for feedback_type, values in form_feedback.items()}
+    questions = {feedback_type: comments for feedback_type, comments in questions.items() if len(comments) > 0}
+
+    cached = {} if previous is None else previous.results
+    texts = {text for comments in questions.values() for text in comments}
+    new = [text for text in texts if text not in cached]
+    analyzed = analyze(new) if len(new) > 0 else {}
+    # Only the form's current comments are kept, so the cache does not grow forever
+    results = {text: cached[text] if text in cached else analyzed[text] for text in texts}
+
+    # Number of comments each keyword appears in, every comment counting as one document
+    documents = [word for comments in questions.values() for text in comments for word in set(results[text][1])]
+    return FormAnalysis(
+        digest,
+        results,
+        {feedback_type: question_statistics(comments, results) for feedback_type, comments in questions.items()},
+        pd.Series(documents, dtype=object).value_counts(),
+        sum(len(comments) for comments in questions.values()),
+    )
+
+def summarize(statistics, idf):
+    # Keywords are the words with the highest TF-IDF summed over the question's comments
+    weights = statistics.tf * idf.reindex(statistics.tf.index).to_numpy()
+    return Summary(
+        statistics.comments,
+        statistics.positive,
+        statistics.comments - statistics.positive - statistics.negative,
+        statistics.negative,
+        statistics.score / statistics.comments,
+        list(weights.nlargest(KEYWORDS).index),
+    )
+
+def combine(questions):
+    # One question's statistics over several forms, for "All"
+    return QuestionStatistics(
+        sum(question.comments for question in questions),
+        sum(question.positive for question in questions),
+        sum(question.negative for question in questions),
+        sum(question.score for question in questions),
+        pd.concat([question.tf for question in questions]).groupby(level=0).sum(),
+    )
+
+class TextAnalytics:
+    """
+    Sentiment and keyword summaries of every form's answers to every
+    feedback question, plus "All" forms. Results are cached per comment and
+    per form, so a refresh or a pushed change only analyzes the comments
+    that were not there before and only tallies the forms that changed.
+    """
+
+    def __init__(self, feedback, forms=None):
+        forms = {} if forms is None else forms
+        self.forms = {}
+        for form, form_feedback in feedback.items():
+            digest = fingerprint(form_feedback)
+            previous = forms.get(form)
+            if previous is not None and previous.fingerprint == digest:
+                self.forms[form] = previous
+            else:
+                self.forms[form] = analyze_form(form_feedback, digest, previous)
+
+        # Smoothed inverse document frequency over the comments of every form
+        frequency = pd.concat([analysis.frequency for analysis in self.forms.values()] + [pd.Series(dtype="int64")]).groupby(level=0).sum()
+        comments = sum(analysis.comments for analysis in self.forms.values())
+        idf = np.log((1 + comments) / (1 + frequency)) + 1
+
+        self.summaries = {}
+        by_type = {}
+        for form in sorted(self.forms):
+            for feedback_type, statistics in self.forms[form].questions.items():
+                self.summaries[(form, feedback_type)] = summarize(statistics, idf)
+                by_type.setdefault(feedback_type, []).append(statistics)
+        for feedback_type, questions in by_type.items():
+            self.summaries[(ALL, feedback_type)] = summarize(combine(questions), idf)
+
+    def updated(self, feedback):
+        return TextAnalytics(feedback, self.forms)
+
+    def without_cache(self):
+        # The same summaries without the per-comment results, for processes that only read them (see data/host.py)
+        analytics = TextAnalytics({})
+        analytics.summaries = self.summaries
+        return analytics
+
+    def summary(self, form, feedback_type):
+        # None when nobody answered the question
+        return self.summaries.get((form, feedback_type))
@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+from collections import deque
+import numpy as np
+import pandas as pd
+
+# Set EENC_TIMING=0 to turn the timers off, timed() then hands out a timer that does nothing
+ENABLED = os.environ.get("EENC_TIMING", "1") != "0"
+
+# Durations kept for every stage, older ones are dropped
+SAMPLES = 1000
+
+class Timings:
+    """
+    Process-wide ring buffer of the most recent durations of every stage,
+    e.g. "Demographics: build professions_bar", shared by all sessions.
+    """
+
+    def __init__(self, samples=SAMPLES):
+        self.samples = samples
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        durations = self.stages.get(stage)
+        if durations is None:
+            with self.lock:
+                durations = self.stages.setdefault(stage, deque(maxlen=self.samples))
+        durations.append(seconds)
+
+    def summary(self):
+        # One row per stage with its latency percentiles in milliseconds
+        rows = []
+        for stage, durations in sorted(self.stages.items()):
+            milliseconds = np.array(durations) * 1000
+            if len(milliseconds) == 0:
+                continue
+            rows.append({
+                "Stage": stage,
+                "Samples": len(milliseconds),
+                "p50 (ms)": np.percentile(milliseconds, 50),
+                "p95 (ms)": np.percentile(milliseconds, 95),
+                "Max (ms)": milliseconds.max(),
+                "Last (ms)": milliseconds[-1],
+            })
+        return pd.DataFrame(rows, columns=["Stage", "Samples", "p50 (ms)", "p95 (ms)", "Max (ms)", "Last (ms)"])
+
+    def clear(self):
+        with self.lock:
+            self.stages = {}
+
+# Shared by every page and session in this server process
+TIMINGS = Timings()
+
+class Timer:
+    """
+    Records how long its with block, or the time between start() and
+    stop(), took under the given stage name.
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.started = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        return self
+
+    def stop(self):
+        if self.started is not None:
+            TIMINGS.record(self.stage, time.perf_counter() - self.started)
+            self.started = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exception):
+        self.stop()
+
+class NoTimer:
+    """
+    Stands in for a Timer when timing is turned off.
+    """
+
+    def start(self):
+        return self
+
+    def stop(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        pass
+
+NO_TIMER = NoTimer()
+
+def timed(stage):
+    return Timer(stage) if ENABLED else NO_TIMER
+
+def plotly_chart(container, figure, stage, **kwargs):
+    # container.plotly_chart, timed, since Streamlit serializes the figure in this call
+    with timed(stage):
+        return container.plotly_chart(figure, **kwargs)
@@ -0,0 +1,104 @@
+import pandas as pd
+from data.aggregates import ALL
+from data.schema import RATING_COLUMNS, GUIDELINE_COLUMNS
+
+# Periods the trend charts can be grouped by, as pandas period codes. Weeks start on Monday.
+FREQUENCIES = {
+    "Day": "D",
+    "Week": "W-SUN",
+    "Month": "M",
+}
+
+# Responses are bucketed by their local date in North Carolina
+TIMEZONE = "America/New_York"
+
+# Columns with a mean in every period
+TREND_COLUMNS = RATING_COLUMNS + GUIDELINE_COLUMNS
+
+def period_starts(timestamps, frequency):
+    # First day of the period each timestamp falls in, as a local date without a time zone
+    local = timestamps.dt.tz_convert(TIMEZONE).dt.tz_localize(None)
+    return local.dt.to_period(FREQUENCIES[frequency]).dt.start_time
+
+def trend_measures(frame):
+    # Response count and, for every column, its number of answers and their sum
+    measures = {("Responses", "n"): pd.Series(1, index=frame.index, dtype="int64")}
+    for column in TREND_COLUMNS:
+        values = frame[column].astype("float64")
+        measures[(column, "n")] = values.notna().astype("int64")
+        measures[(column, "sum")] = values.fillna(0)
+    return pd.DataFrame(measures, index=frame.index)
+
+def rollup(frame, frequency):
+    # Measures summed per form and period, rows without a timestamp are left out
+    frame = frame[frame["Timestamp"].notna()]
+    keys = [frame["Form Name"].astype(object).fillna("N/A"), period_starts(frame["Timestamp"], frequency).rename("Period")]
+    return trend_measures(frame).groupby(keys).sum()
+
+def with_all(table):
+    # Adds the "All" form, the sum of every form in each period
+    everything = table.groupby(level=1).sum()
+    everything.index = pd.MultiIndex.from_product([[ALL], everything.index], names=table.index.names)
+    return pd.concat([table, everything]).sort_index()
+
+def to_series(table, frequency):
+    # Number of responses and the mean of every column in each period, periods without responses included
+    series = pd.DataFrame({"Responses": table[("Responses", "n")]}, index=table.index)
+    for column in TREND_COLUMNS:
+        count = table[(column, "n")]
+        series[column] = (table[(column, "sum")] / count).where(count > 0)
+
+    if len(series) > 0:
+        periods = pd.period_range(series.index.min(), series.index.max(), freq=FREQUENCIES[frequency]).start_time.rename("Period")
+        series = series.reindex(periods)
+        series["Responses"] = series["Responses"].fillna(0).astype("int64")
+    return series
+
+class TrendRollups:
+    """
+    Response counts and rating sums per form by day, week and month, built
+    once per data version from the parsed timestamps. Date ranges are
+    answered from the daily rollup, so the rows are never scanned again.
+    """
+
+    def __init__(self, frame, tables=None):
+        if tables is None:
+            tables = {frequency: with_all(rollup(frame, frequency)) for frequency in FREQUENCIES}
+        self.tables = tables
+
+    def updated(self, removed, added):
+        """
+        Rollups without the removed rows and with the added ones, built by
+        adding and subtracting only the changed rows' buckets.
+        """
+        tables = {}
+        for frequency, table in self.tables.items():
+            change = with_all(rollup(added, frequency)).sub(with_all(rollup(removed, frequency)), fill_value=0)
+            table = table.add(change, fill_value=0)
+            tables[frequency] = table[table[("Responses", "n")] > 0].astype(self.tables[frequency].dtypes.to_dict())
+        return TrendRollups(None, tables)
+
+    def date_range(self, form=ALL):
+        # First and last day with a response, None when there are none
+        table = self.tables["Day"]
+        if form not in table.index.get_level_values(0):
+            return None
+        days = table.loc[form].index
+        return days.min().date(), days.max().date()
+
+    def series(self, frequency, form=ALL, start=None, end=None):
+        """
+        Responses and means per period for a form, optionally limited to the
+        days from start to end inclusive.
+        """
+        if form not in self.tables[frequency].index.get_level_values(0):
+            return to_series(self.tables[frequency].iloc[0:0].droplevel(0), frequency)
+
+        if start is None and end is None:
+            return to_series(self.tables[frequency].loc[form], frequency)
+
+        # Rebuckets the days inside the range, so partial weeks and months only count the days that were picked
+        days = self.tables["Day"].loc[form]
+        days = days[(days.index >= pd.Timestamp(start or days.index.min())) & (days.index <= pd.Timestamp(end or days.index.max()))]
+        periods = days.index.to_period(FREQUENCIES[frequency]).start_time.rename("Period")
+        return to_series(days.groupby(periods).sum(), frequency)
@@ -1,18 +1,30 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import math
+from data.aggregates import responses, mean
+from data.figure_cache import cached_figure
+from data.handle import DATASET
+from data.timing import timed, plotly_chart
 
 # Set page title and favicon
 st.set_page_config(page_title="Demographics", page_icon="assets/EENC-logo.png", layout="wide")
 
+page_timer = timed("Demographics: page").start()
+
 # Load the data
 #data = pd.read_csv("data/data.csv")
 
-# Data from Streamlit state
-data = st.session_state['master_data']
+# The process-wide dataset, read once for the whole rerun
+dataset = DATASET.current(st.session_state)
+if dataset is None:
+    st.write("Open the homepage first to load the data.")
+    st.stop()
+if "formname" not in st.session_state:
+    st.session_state["formname"] = "All"
+data = dataset.master
 #data = st_data
-data = data.replace('N/A', float('nan'))
+aggregates = dataset.aggregates
+partitions = dataset.partitions
 
 #put logo on sidebar
 st.image("assets/EENC-logo.png", width=100)
@@ -30,170 +42,110 @@ st.markdown('This page displays a summary of demographics for EENC courses. Use
 st.markdown("---")
 #Sidebar
 st.sidebar.title("Filter")
-unique_form_names = sorted(data['Form Name'].unique())
-cleaned_form_names = [name.replace('_', ' ').title() for name in unique_form_names]
-
-options = ["All"] + cleaned_form_names
+# Sidebar options, precomputed once per data version
+options = partitions.options
 
 form_name = st.sidebar.selectbox("Select Form Name", options, options.index(st.session_state["formname"]))
 
 st.sidebar.caption("Need more help? Refer to our documentation [here](https://docs.google.com/document/d/19GpSxMp12O3dHoJHs6DARf3IpwtUShdqWRiDNICFZXI/edit?usp=sharing)")
 
 if form_name != 'All':
-    formatted_form_name = f"{form_name.lower().replace(' ', '_')}"
-    data = data[data['Form Name'] == formatted_form_name]
+    formatted_form_name = partitions.key(form_name)
+    data = partitions.frame(formatted_form_name)
     st.session_state["formname"] = form_name
 else:
+    formatted_form_name = "All"
     st.session_state["formname"] = "All"
     
 
 #Profession
-profession = data['Current Profession']
-total_professions = len(profession)
-
-non_formal_educator = data['Current Profession'].str.contains('Non-Formal Educator')
-non_formal_educator_total = non_formal_educator.sum()
-
-conservation_professional = data['Current Profession'].str.contains('Conservation/Natural Resources Professional')
-conservation_professional_total = conservation_professional.sum()
-
-college_instructor = data['Current Profession'].str.contains('College/University Instructor')
-college_instructor_total = college_instructor.sum()
-
-program_director = data['Current Profession'].str.contains('Program Director/Administrator')
-program_director_total = program_director.sum()
-
-school_teacher = data['Current Profession'].str.contains('PreK-12 Classroom Teacher')
-school_teacher_total = school_teacher.sum()
-
-student = data['Current Profession'].str.contains('Student|student')
-student_total = student.sum()
-
-other = data['Current Profession'].str.contains('Non-Formal Educator|Conservation/Natural Resources Professional|College/University Instructor|Program Director/Administrator|PreK-12 Classroom Teacher|Student|student')
-other_total = other.sum()
-
-all_professions = [
-    'Non-Formal Educator', 
-    'Conservation/Natural Resources Professional', 
-    'College/University Instructor',
-    'Program Director/Administrator',
-    'PreK-12 Classroom Teacher',
-    'Student',
-    'Other'
-]
-professions_percentages = [
-    round((non_formal_educator_total/total_professions), 4) * 100,
-    round((conservation_professional_total/total_professions), 4) * 100,
-    round((college_instructor_total/total_professions), 4) * 100,
-    round((program_director_total/total_professions), 4) * 100,
-    round((school_teacher_total/total_professions), 4) * 100,
-    round((student_total/total_professions), 4) * 100,
-    round((other_total/total_professions), 4) * 100
-]
-
-professions_numbers = [
-    non_formal_educator_total,
-    conservation_professional_total,
-    college_instructor_total,
-    program_director_total,
-    school_teacher_total,
-    student_total,
-    other_total
-]
+# Multi-select answers are split into profession buckets once per data refresh
+with timed("Demographics: compute professions"):
+    total_professions = responses(aggregates.view(formatted_form_name))
+    profession_totals = aggregates.profession_totals(formatted_form_name)
+
+    all_professions = list(profession_totals.index)
+    professions_percentages = [
+        round((total/total_professions), 4) * 100 if total_professions > 0 else 0
+        for total in profession_totals
+    ]
+
+    professions_numbers = list(profession_totals)
 
 bar_color = secondary_color
 
-# st.header('Statistics for Instructor Professions')
-professions_bar_fig = px.bar(x=all_professions, y=professions_percentages, labels=dict(x='Professions', y='Percentage (out of Total Instructors)'), color_discrete_sequence=[bar_color])
-professions_bar_fig.update_yaxes(range=[0,100])
+# Figures are shared between sessions and only rebuilt for a new data version or filter
+data_version = data.attrs["version"]
 
-professions_pie_fig = px.pie(values=professions_numbers, names=all_professions, color_discrete_sequence=bar_colors)
-professions_pie_fig.update_traces(textinfo='value')
-professions_pie_fig.update_traces(sort=False)
+def build_professions_bar_fig():
+    fig = px.bar(x=all_professions, y=professions_percentages, labels=dict(x='Professions', y='Percentage (out of Total Instructors)'), color_discrete_sequence=[bar_color])
+    fig.update_yaxes(range=[0,100])
+    return fig
 
-st.header('Distribution of Instructor Professions')
-professions_bar_fig = px.bar(x=all_professions, y=professions_percentages, labels=dict(x='Professions', y='Percentage (out of Total Instructors)'), color_discrete_sequence=[bar_color])
-professions_bar_fig.update_yaxes(range=[0,100])
+def build_professions_pie_fig():
+    fig = px.pie(values=professions_numbers, names=all_professions, color_discrete_sequence=bar_colors)
+    fig.update_traces(textinfo='value',hoverinfo='name',sort=False)
+    fig.update_layout(legend=dict(yanchor="top", y=-0.05, xanchor="left", x=0.01))
+    return fig
 
-professions_pie_fig = px.pie(values=professions_numbers, names=all_professions, color_discrete_sequence=bar_colors)
-professions_pie_fig.update_traces(textinfo='value',hoverinfo='name',sort=False)
-professions_pie_fig.update_layout(legend=dict(yanchor="top", y=-0.05, xanchor="left", x=0.01))
+st.header('Distribution of Instructor Professions')
+professions_bar_fig = cached_figure(data_version, 'Demographics', 'professions_bar', [formatted_form_name], build_professions_bar_fig)
+professions_pie_fig = cached_figure(data_version, 'Demographics', 'professions_pie', [formatted_form_name], build_professions_pie_fig)
 
 col1, col2 = st.columns(2, gap="large")
 col1.subheader('by Percentage')
 col1.caption("This bar graph depicts the percentage of instructors in each profession.")
 col1.caption("Due to potential overlap, percentages may add up to greater than 100%.")
-col1.plotly_chart(professions_bar_fig,use_container_width=True)
+plotly_chart(col1, professions_bar_fig, 'Demographics: draw professions_bar', use_container_width=True)
 col2.subheader('by Frequency')
 col2.caption("This pie chart depicts the number of instructors in each profession.")
 col2.caption("Due to potential overlap, the numbers on the pie chart might be greater than the total number of instructors.")
-col2.plotly_chart(professions_pie_fig,use_container_width=True)
+plotly_chart(col2, professions_pie_fig, 'Demographics: draw professions_pie', use_container_width=True)
 
 #student count for each teacher
-data['Student Count'] = pd.to_numeric(data['Student Count'], errors="coerce")
 student_count = data['Student Count']
-#student_count = pd.to_numeric(data['Student Count'], errors="coerce")
-average_student_count = round(student_count.mean(), 2)
+with timed("Demographics: compute student counts"):
+    student_count_summary = aggregates.student_count_summary(formatted_form_name)
+average_student_count = round(student_count_summary['Average student count'], 2)
 
 st.header('Statistics for Student to Instructor Ratio')
 col1, col2 = st.columns(2)
 col1.metric("Average student count per instructor", average_student_count)
-col1.metric("Smallest student count", data['Student Count'].min())
-col2.metric("Median student count per instructor", data['Student Count'].median())
-col2.metric("Largest student count", data['Student Count'].max())
+col1.metric("Smallest student count", student_count_summary['Smallest student count'])
+col2.metric("Median student count per instructor", student_count_summary['Median student count'])
+col2.metric("Largest student count", student_count_summary['Largest student count'])
 
 
 #relation between student count and course rating
 #data['Instructor Rating'] = data['Instructor Rating'].astype(int)
 st.subheader('Correlation between Student-to-Instructor Ratio and Instructor Rating')
 course_rating = data['Instructor Rating']
-if not math.isnan(course_rating.mean()):
-    student_count_to_course_rating_fig = px.scatter(x=student_count, y=course_rating, labels=dict(x='Student Count',y='Instructor Rating'), color_discrete_sequence=[bar_color])
-    student_count_to_course_rating_fig.update_xaxes(range=[-100,3200])
-    student_count_to_course_rating_fig.update_yaxes(range=[0,5.2])
-    student_count_to_course_rating_fig.update_traces(marker=dict(size=12, line=dict(width=1.5, color='Black')), selector=dict(mode='markers'))
+instructor_rating_mean = mean(aggregates.view(formatted_form_name), 'Instructor Rating')
+
+def build_student_count_to_course_rating_fig():
+    fig = px.scatter(x=student_count, y=course_rating, labels=dict(x='Student Count',y='Instructor Rating'), color_discrete_sequence=[bar_color])
+    fig.update_xaxes(range=[-100,3200])
+    fig.update_yaxes(range=[0,5.2])
+    fig.update_traces(marker=dict(size=12, line=dict(width=1.5, color='Black')), selector=dict(mode='markers'))
+    return fig
+
+if not pd.isna(instructor_rating_mean):
+    student_count_to_course_rating_fig = cached_figure(data_version, 'Demographics', 'student_count_to_course_rating', [formatted_form_name], build_student_count_to_course_rating_fig)
     st.caption("This scatterplot depicts how instructor ratings correspond to an instructor's student-to-instructor ratio, in order to determine how an instructor's abilities are affected by higher student counts.")
     st.caption('Please note that some outlier values are not depicted on the graph for better visibility.')
-    st.plotly_chart(student_count_to_course_rating_fig)
+    plotly_chart(st, student_count_to_course_rating_fig, 'Demographics: draw student_count_to_course_rating')
 else:
     st.write("No instructor ratings available.")
 
 
 #relation between location and course rating
-rural_student_count = data[data['Student Location']=='Rural']['Student Count']
-average_rural_student_count = round(rural_student_count.mean(), 2)
-suburban_student_count = data[data['Student Location']=='Suburban']['Student Count']
-average_suburban_student_count = round(suburban_student_count.mean(), 2)
-urban_student_count = data[data['Student Location']=='Urban']['Student Count']
-average_urban_student_count = round(urban_student_count.mean(), 2)
-mix_student_count = data[data['Student Location'].str.contains('Mix of Areas', na=False)]['Student Count']
-average_mix_student_count = round(mix_student_count.mean(), 2)
-
-student_location = data['Student Location']
-student_location = student_location.replace("A Mix of Areas", "Mix of Areas")
-
-
-student_location_to_course_rating_fig = px.strip(x=student_location, y=course_rating, color_discrete_sequence=[bar_color], labels=dict(x='Student Location',y='Instructor Rating'))
-student_location_to_course_rating_fig.update_yaxes(range=[0,5.4])
-
-
 st.header('Statistics for Student Location')
 
-measures = {
-    'Location':['Mix of Areas', 'Rural', 'Suburban', 'Urban'],
-    'Number of instructors':[len(mix_student_count), len(rural_student_count), len(suburban_student_count), len(urban_student_count)],
-    'Average student count':[average_mix_student_count, average_rural_student_count, average_suburban_student_count, average_urban_student_count],
-    'Median student count':[mix_student_count.median(), rural_student_count.median(), suburban_student_count.median(), urban_student_count.median()],
-    'Smallest student count':[mix_student_count.min(), rural_student_count.min(), suburban_student_count.min(), urban_student_count.min()],
-    'Largest student count':[mix_student_count.max(), rural_student_count.max(), suburban_student_count.max(), urban_student_count.max()]
-}
-measures_frame = pd.DataFrame(data=measures)
+# Per-location statistics, computed once per data refresh
+with timed("Demographics: compute location table"):
+    measures_frame = aggregates.location_table(formatted_form_name)
 st.dataframe(measures_frame.style.format({'Average student count': "{:.2f}", 'Median student count': "{:.2f}", 'Smallest student count': "{:.2f}", 'Largest student count': "{:.2f}"}))
 
-rural_course_rating = data[data['Student Location']=='Rural']['Instructor Rating']
-suburban_course_rating = data[data['Student Location']=='Suburban']['Instructor Rating']
-urban_course_rating = data[data['Student Location']=='Urban']['Instructor Rating']
-mix_course_rating = data[data['Student Location'].str.contains('Mix of Areas', na=False)]['Instructor Rating']
 
 #location_ratings = {
     #'Student Location':['Mix of Areas', 'Rural', 'Suburban', 'Urban'],
@@ -204,23 +156,19 @@ mix_course_rating = data[data['Student Location'].str.contains('Mix of Areas', n
     #'5':[round((mix_course_rating==5).sum()/len(mix_course_rating), 4) * 100, round((rural_course_rating==5).sum()/len(rural_course_rating), 4) * 100, round((suburban_course_rating==5).sum()/len(suburban_course_rating), 4) * 100, round((urban_course_rating==5).sum()/len(urban_course_rating), 4) * 100]
 #}
 
-location_ratings = {
-    'Student Location':['Mix of Areas', 'Rural', 'Suburban', 'Urban'],
-    '1':[(mix_course_rating==1).sum(), (rural_course_rating==1).sum(), (suburban_course_rating==1).sum(), (urban_course_rating==1).sum()],
-    '2':[(mix_course_rating==2).sum(), (rural_course_rating==2).sum(), (suburban_course_rating==2).sum(), (urban_course_rating==2).sum()],
-    '3':[(mix_course_rating==3).sum(), (rural_course_rating==3).sum(), (suburban_course_rating==3).sum(), (urban_course_rating==3).sum()],
-    '4':[(mix_course_rating==4).sum(), (rural_course_rating==4).sum(), (suburban_course_rating==4).sum(), (urban_course_rating==4).sum()],
-    '5':[(mix_course_rating==5).sum(), (rural_course_rating==5).sum(), (suburban_course_rating==5).sum(), (urban_course_rating==5).sum()]
-}
-
 st.subheader('Correlation between Student Location and Instructor Rating')
 
-if not math.isnan(course_rating.mean()):
-    location_ratings_frame = pd.DataFrame(data=location_ratings)
-    location_to_rating_bar_fig = px.bar(data_frame=location_ratings_frame, x='Student Location', y=['1', '2', '3', '4', '5'], color_discrete_sequence=other_bar_colors, text_auto=True)
-    location_to_rating_bar_fig.update_layout(legend_title_text='Instructor Rating', yaxis_title='Number of Ratings') 
+def build_location_to_rating_bar_fig():
+    # Instructor rating counts for each location, read from the precomputed aggregates
+    location_ratings_frame = aggregates.location_ratings(formatted_form_name, 'Instructor Rating')
+    fig = px.bar(data_frame=location_ratings_frame, x='Student Location', y=['1', '2', '3', '4', '5'], color_discrete_sequence=other_bar_colors, text_auto=True)
+    fig.update_layout(legend_title_text='Instructor Rating', yaxis_title='Number of Ratings')
+    return fig
+
+if not pd.isna(instructor_rating_mean):
+    location_to_rating_bar_fig = cached_figure(data_version, 'Demographics', 'location_to_rating_bar', [formatted_form_name], build_location_to_rating_bar_fig)
     st.caption('This segmented bar graph depicts how instructor ratings differ based on student location. Each bar segement represents the number of instructors that received that particular rating value.')
-    st.plotly_chart(location_to_rating_bar_fig)
+    plotly_chart(st, location_to_rating_bar_fig, 'Demographics: draw location_to_rating_bar')
 
 else:
     st.write("No instructor ratings available.")
@@ -237,6 +185,10 @@ st.markdown(f"""
         h1, h2, h3, h4, h5, h6 {{
             color: {primary_color};
         }}
+        /* The diagnostics page is only reached by its URL, /perf */
+        [data-testid="stSidebarNav"] li:has(a[href$="/perf"]) {{
+            display: none;
+        }}
         .css-1qpc1ke a {{
             color: {secondary_color};
         }}
@@ -250,4 +202,6 @@ hide_default_format = """
        footer {visibility: hidden;}
        </style>
        """
-st.markdown(hide_default_format, unsafe_allow_html=True)
\ No newline at end of file
+st.markdown(hide_default_format, unsafe_allow_html=True)
+
+page_timer.stop()
\ No newline at end of file
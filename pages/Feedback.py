@@ -1,17 +1,28 @@
 import pandas as pd
 import streamlit as st
+import math
 import random
+from data.feedback_index import feedback_title
+from data.handle import DATASET
+from data.timing import timed
 
 # Set page title and favicon
 st.set_page_config(page_title="Feedback",
                    page_icon="assets/EENC-logo.png", layout="wide")
 
-# Data from Streamlit state
-data = st.session_state["master_data"]
-feedback_data = st.session_state["feedback_data"]
+page_timer = timed("Feedback: page").start()
 
-# replace 'N/A' with NaN
-data = data.replace('N/A', float('nan'))
+# The process-wide dataset, read once for the whole rerun
+dataset = DATASET.current(st.session_state)
+if dataset is None:
+    st.write("Open the homepage first to load the data.")
+    st.stop()
+if "formname" not in st.session_state:
+    st.session_state["formname"] = "All"
+data = dataset.master
+feedback_index = dataset.feedback_index
+search = dataset.search
+partitions = dataset.partitions
 
 # Set constants for theme colors
 primary_color = "#195E4C"
@@ -20,22 +31,19 @@ text_color = "#6D7183"
 
 # Sidebar
 st.sidebar.title("Filter")
-unique_form_names = sorted(data['Form Name'].unique())
-cleaned_form_names = [name.replace('_', ' ').title() for name in unique_form_names]
-
-options = ["All"] + cleaned_form_names
+# Sidebar options, precomputed once per data version
+options = partitions.options
 
 form_name = st.sidebar.selectbox("Select Form Name", options, options.index(st.session_state["formname"]))
 
 st.sidebar.caption("Need more help? Refer to our documentation [here](https://docs.google.com/document/d/19GpSxMp12O3dHoJHs6DARf3IpwtUShdqWRiDNICFZXI/edit?usp=sharing)")
 
 if form_name != 'All':
-    formatted_form_name = f"{form_name.lower().replace(' ', '_')}"
-    data = data[data['Form Name'] == formatted_form_name]
-    feedback_data = feedback_data[formatted_form_name]
+    formatted_form_name = partitions.key(form_name)
+    data = partitions.frame(formatted_form_name)
     st.session_state["formname"] = form_name
 else:
-    feedback_data = {k: v for d in feedback_data.values() for k, v in d.items()}
+    formatted_form_name = "All"
     st.session_state["formname"] = "All"
 # Logo
 st.image("assets/EENC-logo.png", width=100)
@@ -45,33 +53,63 @@ st.title("EENC Feedback")
 st.write("This page displays every feedback participants have in all workshops from EENC. Use the filter on the left to customize the results.")
 st.markdown('  ')
 
-def generate_feedback_list(feedback_type):
-    if feedback_type in feedback_data and len(feedback_data[feedback_type]) > 0:
-        feedback_list = [feedback for feedback in feedback_data[feedback_type] if feedback.lower() != "n/a"]
-        if len(feedback_list) > 0:
-            title = " ".join([word.capitalize() for word in feedback_type.split("_")])
-            return (title, feedback_list)
-        else:
-            return None
-
-feedback_tabs = []
-feedback_types = ["general_feedback", "instructor_feedback", "accessibility_feedback", 
-                  "rating_feedback", "accessibility_feedback", "structure_feedback", 
-                  "topics_feedback", "activity_removal_feedback"]
-for feedback_type in feedback_types:
-    feedback = generate_feedback_list(feedback_type)
-    if feedback is not None:
-        feedback_tabs.append(feedback)
-
-if len(feedback_tabs) > 0:
-    tabs = st.tabs([feedback[0] for feedback in feedback_tabs])
-    for feedback, tab in zip(feedback_tabs, tabs):
+query = st.text_input("Search feedback", placeholder='e.g. videos "too long"', help="Shows the comments containing every word, put a phrase in quotes to match it exactly.").strip()
+
+# Number of comments sent to the browser at a time
+PAGE_SIZE = 50
+
+def load_more(shown_key):
+    st.session_state[shown_key] += 1
+
+def reset_shown(shown_key):
+    st.session_state[shown_key] = 1
+
+def show_feedback(feedback_type):
+    # Only the comments of the selected page, and any pages loaded below it, are sent to the browser
+    if query:
+        with timed("Feedback: search"):
+            results = search.search(query, formatted_form_name, feedback_type)
+        total = results.count
+        if total == 0:
+            st.info("No comments match the search.")
+            return
+    else:
+        total = feedback_index.count(formatted_form_name, feedback_type)
+    pages = math.ceil(total / PAGE_SIZE)
+    # One pager per form and feedback type, a new search starts again from the first page
+    key = f"{formatted_form_name}_{feedback_type}"
+    shown_key, page_key, query_key = f"feedback_shown_{key}", f"feedback_page_{key}", f"feedback_query_{key}"
+    if st.session_state.get(query_key) != query or st.session_state.get(page_key, 1) > pages:
+        st.session_state[query_key] = query
+        st.session_state[shown_key] = 1
+        st.session_state[page_key] = 1
+    st.session_state.setdefault(shown_key, 1)
+    st.session_state.setdefault(page_key, 1)
+
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, key=page_key, on_change=reset_shown, args=(shown_key,))
+
+    start = (page - 1) * PAGE_SIZE
+    stop = min(start + st.session_state[shown_key] * PAGE_SIZE, total)
+    with timed("Feedback: slice comments"):
+        comments = results.page(start, stop) if query else feedback_index.page(formatted_form_name, feedback_type, start, stop)
+
+    st.caption(f"Showing {start + 1} to {stop} of {total} {'matching ' if query else ''}comments")
+    feedback_str = "\n".join([f"- {comment}\n" for comment in comments])
+    st.info(f"\n\n{feedback_str}")
+
+    if stop < total:
+        st.button("Load more", key=f"feedback_more_{key}", on_click=load_more, args=(shown_key,))
+
+feedback_types = feedback_index.types(formatted_form_name)
+if len(feedback_types) > 0:
+    tabs = st.tabs([feedback_title(feedback_type) for feedback_type in feedback_types])
+    for feedback_type, tab in zip(feedback_types, tabs):
         with tab:
-            if len(feedback[1]) > 0:
-                feedback_str = "\n".join([f"- {f}\n" if f else "" for f in feedback[1]])
-                st.info(f"\n\n{feedback_str}")
-            else:
-                st.info(f"No {feedback[0]} found.")
+            show_feedback(feedback_type)
+else:
+    st.write("No feedback found.")
 
 
 # Add CSS to customize text colors
@@ -86,6 +124,10 @@ st.markdown(f"""
         h1, h2, h3, h4 {{
             color: {primary_color};
         }}
+        /* The diagnostics page is only reached by its URL, /perf */
+        [data-testid="stSidebarNav"] li:has(a[href$="/perf"]) {{
+            display: none;
+        }}
         .css-1qpc1ke a {{
             color: {secondary_color};
         }}
@@ -100,3 +142,5 @@ hide_default_format = """
        </style>
        """
 st.markdown(hide_default_format, unsafe_allow_html=True)
+
+page_timer.stop()
@@ -4,54 +4,64 @@ import streamlit as st
 import matplotlib as mat
 import matplotlib.pyplot as plt
 import plotly.express as px
+import plotly.graph_objects as go
+from data.aggregates import responses, distribution, at_least
+from data.guidelines import GUIDELINE_LEVELS, transition_matrix, gains
+from data.figure_cache import cached_figure
+from data.handle import DATASET
+from data.timing import timed, plotly_chart
 
 # Set page title and favicon
 st.set_page_config(page_title="Guidelines",
                    page_icon="assets/EENC-logo.png", layout="wide")
 
+page_timer = timed("Guidelines: page").start()
+
 # data = pd.read_csv("data/data.csv")
 
-# Data from Streamlit state
-data = st.session_state['master_data']
+# The process-wide dataset, read once for the whole rerun
+dataset = DATASET.current(st.session_state)
+if dataset is None:
+    st.write("Open the homepage first to load the data.")
+    st.stop()
+if "formname" not in st.session_state:
+    st.session_state["formname"] = "All"
+data = dataset.master
 #data = st_data
+aggregates = dataset.aggregates
+partitions = dataset.partitions
+
+# Figures are shared between sessions and only rebuilt for a new data version or filter
+data_version = data.attrs["version"]
 
 
 st.image("assets/EENC-logo.png", width = 100)
-unique_form_names = sorted(data['Form Name'].unique())
-cleaned_form_names = [name.replace('_', ' ').title() for name in unique_form_names]
 
 
 
 # sidebar
 st.sidebar.title("Filters")
 
-options = ["All"] + cleaned_form_names
+# Sidebar options, precomputed once per data version
+options = partitions.options
 
 form_name = st.sidebar.selectbox("Select Form Name", options, options.index(st.session_state["formname"]))
 
 # Filter the data
 if form_name != 'All': #event name
-    formatted_form_name = f"{form_name.lower().replace(' ', '_')}"
-    data = data[data['Form Name'] == formatted_form_name]
+    formatted_form_name = partitions.key(form_name)
     st.session_state["formname"] = form_name
 else:
+    formatted_form_name = "All"
     st.session_state["formname"] = "All"
 
-# Get unique locations and remove "None"
-unique_locations = data['Student Location'].dropna().unique()
-# Group "Mix of Areas" and "A Mix of Areas"
-unique_locations = np.where(unique_locations=="Mix of Areas", "A Mix of Areas", unique_locations)
-unique_locations = data['Student Location'].dropna().replace({'A Mix of Areas': 'Mix of Areas'}).unique()
+# Locations of the selected form, "Mix of Areas" and "A Mix of Areas" are already grouped
+unique_locations = aggregates.location_options(formatted_form_name)
 location = st.sidebar.radio("Student Location", ["All"] + list(unique_locations))
 st.sidebar.caption("Need more help? Refer to our documentation [here](https://docs.google.com/document/d/19GpSxMp12O3dHoJHs6DARf3IpwtUShdqWRiDNICFZXI/edit?usp=sharing)")
-if location == "Mix of Areas":
-    data_Mix = data[data["Student Location"] == location]
-    data_AMix = data[data["Student Location"] == "A Mix of Areas"]
-    frames = [data_Mix, data_AMix]
-    data = pd.concat(frames)
-else:
-    if location != "All":
-        data = data[data["Student Location"] == location]
+
+# Precomputed counts for the selected form and location
+view = aggregates.view(formatted_form_name, location)
 
 # Main content
 st.title("Guidelines Summary")
@@ -67,28 +77,23 @@ mat.rcParams['axes.labelcolor'] = text_color
 mat.rcParams['xtick.color'] = text_color
 mat.rcParams['ytick.color'] = text_color
 
-# Get guidelines data
-guidelines_before = data['Guidelines Before']
-guidelines_after = data['Guidelines After']
-guidelines_scale = {"Very Low": 1, "Low": 2, "Average": 3, "High": 4, "Very High": 5}
-
-# convert float values to categories
-categories_before = pd.cut(guidelines_before, bins=[0.0, 1.0, 2.0, 3.0, 4.0, 5.0], labels=["Very Low", "Low", "Average", "High", "Very High"])
-categories_after = pd.cut(guidelines_after, bins=[0.0, 1.0, 2.0, 3.0, 4.0, 5.0], labels=["Very Low", "Low", "Average", "High", "Very High"])
 # count the categories
-counts_before = categories_before.value_counts().reindex(["Very Low", "Low", "Average", "High", "Very High"])
-counts_after = categories_after.value_counts().reindex(["Very Low", "Low", "Average", "High", "Very High"])
+with timed("Guidelines: compute counts"):
+    counts_before = distribution(view, 'Guidelines Before', labelled=True)
+    counts_after = distribution(view, 'Guidelines After', labelled=True)
+    transitions = transition_matrix(view)
 st.header("Graphs & Trends")
 st.subheader("How do guidelines change before and after?")
 st.markdown("*Circle size indicates number of population; Numbers of students are shown in the box.")
 st.markdown("")
 
 #calculate stats
-total_students = len(guidelines_after)
-perc_high_before = np.nan_to_num(100 * np.sum(guidelines_before >= 4) / total_students)
-perc_high_after = np.nan_to_num(100 * np.sum(guidelines_after >= 4) / total_students)
-perc_vhigh_before = np.nan_to_num(100 * np.sum(guidelines_before >= 5) / total_students)
-perc_vhigh_after = np.nan_to_num(100 * np.sum(guidelines_after >= 5) / total_students)
+total_students = responses(view)
+# Answers of 4 and above, so averaged answers like 3.5 are not counted as High
+perc_high_before = 100 * at_least(view, 'Guidelines Before', 4) / total_students if total_students > 0 else 0
+perc_high_after = 100 * at_least(view, 'Guidelines After', 4) / total_students if total_students > 0 else 0
+perc_vhigh_before = 100 * at_least(view, 'Guidelines Before', 5) / total_students if total_students > 0 else 0
+perc_vhigh_after = 100 * at_least(view, 'Guidelines After', 5) / total_students if total_students > 0 else 0
 
 #Figure 1: Scatter plot and lines
 
@@ -99,27 +104,30 @@ with st.container():
         st.metric(label="High %", value=f"{round(perc_high_after, 1)}%", delta=f"{round(perc_high_after - perc_high_before, 1)}%")
         st.metric(label="Very High %", value=f"{round(perc_vhigh_after, 1)}%", delta=f"{round(perc_vhigh_after - perc_vhigh_before, 1)}%")
     with col2:
-        data = pd.DataFrame({
-            "When Education is Received": 5 * ["Before"] + 5 * ["After"],
-            "Guidelines Rating": ["Very Low", "Low", "Average", "High", "Very High"] * 2,
-            "Counts": pd.concat([counts_before, counts_after]).reset_index(drop=True)
-        })
-        data = data.dropna()  # drop rows with NaN values
-        data["Size"] = data["Counts"] * 10
-        fig = px.scatter(data, x="When Education is Received", y="Guidelines Rating", size="Size",
-                         color_discrete_sequence=[secondary_color], opacity=1,
-                         labels={"When Education is Received": "When Education is Received", "Guidelines Rating": "Guidelines Rating"},
-                         hover_data={"Counts": True, "Size": False})
-        fig.update_traces(marker=dict(line=dict(width=1, color='DarkSlateGrey')), selector=dict(mode='markers'))
-        fig.update_layout(
-            legend=dict(traceorder='normal'),
-            xaxis=dict(tickfont=dict(size=10)),
-            yaxis=dict(tickfont=dict(size=10)),
-            margin=dict(l=0, r=0, t=50, b=0),
-            width=1200,
-            height=400
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        def build_scatter_fig():
+            points = pd.DataFrame({
+                "When Education is Received": 5 * ["Before"] + 5 * ["After"],
+                "Guidelines Rating": GUIDELINE_LEVELS * 2,
+                "Counts": pd.concat([counts_before, counts_after]).reset_index(drop=True)
+            })
+            points["Size"] = points["Counts"] * 10
+            fig = px.scatter(points, x="When Education is Received", y="Guidelines Rating", size="Size",
+                             color_discrete_sequence=[secondary_color], opacity=1,
+                             labels={"When Education is Received": "When Education is Received", "Guidelines Rating": "Guidelines Rating"},
+                             hover_data={"Counts": True, "Size": False})
+            fig.update_traces(marker=dict(line=dict(width=1, color='DarkSlateGrey')), selector=dict(mode='markers'))
+            fig.update_layout(
+                legend=dict(traceorder='normal'),
+                xaxis=dict(tickfont=dict(size=10)),
+                yaxis=dict(tickfont=dict(size=10)),
+                margin=dict(l=0, r=0, t=50, b=0),
+                width=1200,
+                height=400
+            )
+            return fig
+
+        fig = cached_figure(data_version, 'Guidelines', 'before_after_scatter', [formatted_form_name, location], build_scatter_fig)
+        plotly_chart(st, fig, 'Guidelines: draw before_after_scatter', use_container_width=True)
 
 
 
@@ -130,33 +138,74 @@ st.markdown("Below shows the overall pattern of students' guidelines.")
 
 #Figure 2: bar plot
 
-edu_time = ["Before", "After"]
-y = {
-    "Very Low": [counts_before["Very Low"], counts_after["Very Low"]],
-    "Low": [counts_before["Low"], counts_after["Low"]],
-    "Average": [counts_before["Average"], counts_after["Average"]],
-    "High": [counts_before["High"], counts_after["High"]],
-    "Very High": [counts_before["Very High"], counts_after["Very High"]]
-}
 barcolor = ['#42B6ED', '#42DBED', '#45F7DA', '#4AE19C', '#3C9E8D']
 
-data = []
-for group, barvalue in y.items():
-    data.extend([{"When Education is Received": edu_time[i], "Guidelines Rating": group, "Counts": barvalue[i]} for i in range(len(edu_time))])
+def build_bar_fig():
+    # Ten bars, one per level before and after, straight from the counts
+    bars = pd.DataFrame({
+        "When Education is Received": ["Before", "After"] * 5,
+        "Guidelines Rating": np.repeat(GUIDELINE_LEVELS, 2),
+        "Counts": np.column_stack([counts_before, counts_after]).ravel(),
+    })
+
+    fig = px.bar(bars, x="When Education is Received", y="Counts", color="Guidelines Rating", text="Counts",
+                 color_discrete_sequence=barcolor, barmode="group", opacity=1,
+                 labels={"When Education is Received": "When Education is Received", "Counts": "Number of Participants", "Guidelines Rating": "Guidelines Rating"},
+                 hover_data={"Counts": True})
+
+    fig.update_layout(
+        xaxis=dict(tickfont=dict(size=10)),
+        yaxis=dict(tickfont=dict(size=10)),
+        legend=dict(traceorder='normal')
+    )
+    return fig
 
-fig = px.bar(data, x="When Education is Received", y="Counts", color="Guidelines Rating", text="Counts",
-             color_discrete_sequence=barcolor, barmode="group", opacity=1,
-             labels={"When Education is Received": "When Education is Received", "Counts": "Number of Participants", "Guidelines Rating": "Guidelines Rating"},
-             hover_data={"Counts": True})
+fig = cached_figure(data_version, 'Guidelines', 'before_after_bar', [formatted_form_name, location], build_bar_fig)
 
-fig.update_layout(
-    xaxis=dict(tickfont=dict(size=10)),
-    yaxis=dict(tickfont=dict(size=10)),
-    legend=dict(traceorder='normal')
-)
+with st.container():
+    plotly_chart(st, fig, 'Guidelines: draw before_after_bar')
+
+st.markdown('   ')
+st.subheader("How did each participant's guidelines change?")
+st.markdown("Only participants who answered both the before and the after question are counted.")
 
+#Figure 3: transition heatmap and flows
+change = gains(transitions)
 with st.container():
-    st.plotly_chart(fig)
+    col1, col2 = st.columns([1, 3.75])
+    with col1:
+        st.metric(label="Participants", value=change["Participants"])
+        if change["Participants"] > 0:
+            st.metric(label="Improved %", value=f"{round(100 * change['Improved'] / change['Participants'], 1)}%")
+            st.metric(label="Unchanged %", value=f"{round(100 * change['Unchanged'] / change['Participants'], 1)}%")
+            st.metric(label="Declined %", value=f"{round(100 * change['Declined'] / change['Participants'], 1)}%")
+            st.metric(label="Average Change", value=f"{change['Average change']:+.2f} levels")
+    with col2:
+        def build_heatmap_fig():
+            fig = px.imshow(transitions, text_auto=True, color_continuous_scale=["white", secondary_color, primary_color],
+                            labels={"x": "Guidelines After", "y": "Guidelines Before", "color": "Participants"}, aspect="auto")
+            fig.update_layout(margin=dict(l=0, r=0, t=30, b=0), height=400)
+            return fig
+
+        def build_sankey_fig():
+            # Before levels on the left, after levels on the right, one flow per before x after pair
+            counts = transitions.to_numpy()
+            before, after = np.nonzero(counts)
+            fig = go.Figure(go.Sankey(
+                node=dict(label=[f"{level} before" for level in GUIDELINE_LEVELS] + [f"{level} after" for level in GUIDELINE_LEVELS],
+                          color=barcolor * 2, pad=15),
+                link=dict(source=before, target=after + len(GUIDELINE_LEVELS), value=counts[before, after]),
+            ))
+            fig.update_layout(margin=dict(l=0, r=0, t=30, b=0), height=400)
+            return fig
+
+        heatmap_tab, sankey_tab = st.tabs(["Transition Matrix", "Flows"])
+        with heatmap_tab:
+            fig = cached_figure(data_version, 'Guidelines', 'transition_heatmap', [formatted_form_name, location], build_heatmap_fig)
+            plotly_chart(st, fig, 'Guidelines: draw transition_heatmap', use_container_width=True)
+        with sankey_tab:
+            fig = cached_figure(data_version, 'Guidelines', 'transition_sankey', [formatted_form_name, location], build_sankey_fig)
+            plotly_chart(st, fig, 'Guidelines: draw transition_sankey', use_container_width=True)
 
 
 
@@ -172,8 +221,14 @@ st.markdown(f"""
         h1, h2, h3, h4, h5, h6 {{
             color: {primary_color};
         }}
+        /* The diagnostics page is only reached by its URL, /perf */
+        [data-testid="stSidebarNav"] li:has(a[href$="/perf"]) {{
+            display: none;
+        }}
         .css-1qpc1ke a {{
             color: {secondary_color};
         }}
     </style>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+page_timer.stop()
@@ -1,22 +1,38 @@
 import pandas as pd
 import streamlit as st
 import plotly.express as px
-from streamlit_extras.switch_page_button import switch_page
 import random
+from data.aggregates import SCALE, rating_statistics
+from data.figure_cache import cached_figure
+from data.handle import DATASET
+from data.timing import timed, plotly_chart
+from data.trends import FREQUENCIES
 
 # Set page title and favicon
 st.set_page_config(page_title="Ratings",
                    page_icon="assets/EENC-logo.png", layout="wide")
 
+page_timer = timed("Ratings: page").start()
+
 # Load the data
 # data = pd.read_csv("data/data.csv")
 
-# Data from Streamlit state
-data = st.session_state["master_data"]
-feedback_data = st.session_state["feedback_data"]
+# The process-wide dataset, read once for the whole rerun
+dataset = DATASET.current(st.session_state)
+if dataset is None:
+    st.write("Open the homepage first to load the data.")
+    st.stop()
+if "formname" not in st.session_state:
+    st.session_state["formname"] = "All"
+data = dataset.master
+feedback_index = dataset.feedback_index
+analytics = dataset.analytics
+aggregates = dataset.aggregates
+partitions = dataset.partitions
+trends = dataset.trends
 
-# replace 'N/A' with NaN
-data = data.replace('N/A', float('nan'))
+# Figures are shared between sessions and only rebuilt for a new data version or filter
+data_version = data.attrs["version"]
 
 # Set constants for theme colors
 primary_color = "#195E4C"
@@ -30,49 +46,62 @@ st.image("assets/EENC-logo.png", width=100)
 st.sidebar.title("Filter")
 ## form_name = st.sidebar.selectbox(
     ##"Select Form Name", ['All'] + sorted(data['Form Name'].unique()))
-unique_form_names = sorted(data['Form Name'].unique())
-cleaned_form_names = [name.replace('_', ' ').title() for name in unique_form_names]
-
-options = ["All"] + cleaned_form_names
+# Sidebar options, precomputed once per data version
+options = partitions.options
 
 form_name = st.sidebar.selectbox("Select Form Name", options, options.index(st.session_state["formname"]))
 
 st.sidebar.caption("Need more help? Refer to our documentation [here](https://docs.google.com/document/d/19GpSxMp12O3dHoJHs6DARf3IpwtUShdqWRiDNICFZXI/edit?usp=sharing)")
 
 if form_name != 'All':
-    formatted_form_name = f"{form_name.lower().replace(' ', '_')}"
-    data = data[data['Form Name'] == formatted_form_name]
-    feedback_data = feedback_data[formatted_form_name]
+    formatted_form_name = partitions.key(form_name)
+    data = partitions.frame(formatted_form_name)
     st.session_state["formname"] = form_name
 else:
+    formatted_form_name = "All"
     st.session_state["formname"] = "All"
 
+# Precomputed counts and sums for the selected form
+view = aggregates.view(formatted_form_name)
+
 # Main content
 st.title("EENC Ratings Summary")
 st.write("This page displays a summary of ratings for EENC courses. Use the filter on the left to customize the results.")
 st.markdown('---')
 
+# Counts, n, mean, median and mode of every rating for the selected form, unanswered questions left out
+with timed("Ratings: compute statistics"):
+    statistics = rating_statistics(view)
+
 def generate_rating_chart(column_name, chart_title, feedback_type=None, index=0):
-    column_data = data[column_name]
-    column_data = column_data.astype(float)
-    column_data = data[column_name].fillna(3)
-    average_rating = round(column_data.mean(), 2)
-    mode_rating = column_data.mode()[0] if not column_data.empty else 0
-    median_rating = column_data.median() if not column_data.empty else 0
-
-    if average_rating == mode_rating == median_rating == 3.0:
+    rating = statistics.loc[column_name]
+
+    # Questions nobody answered, e.g. ones a form does not ask, are not shown
+    if rating["n"] == 0:
         return
     else:
-        fig = px.histogram(data, x=column_name, nbins=5, opacity=1, color_discrete_sequence=[secondary_color], height=350)
-        
-        fig.update_layout(
-            xaxis_title="Rating",
-            yaxis_title="Count",
-            showlegend=False,
-            margin=dict(t=0),
-            plot_bgcolor="white",
-            paper_bgcolor="white",
-        )
+        counts = rating[SCALE].astype(int)
+        average_rating = round(rating["mean"], 2)
+        mode_rating = int(rating["mode"])
+        median_rating = rating["median"]
+
+        def build_fig():
+            # Built from the five counts, so the chart stays the same size however many responses there are
+            fig = px.bar(x=SCALE, y=counts.to_numpy(), opacity=1, color_discrete_sequence=[secondary_color], height=350)
+
+            fig.update_layout(
+                xaxis_title="Rating",
+                yaxis_title="Count",
+                showlegend=False,
+                margin=dict(t=0),
+                plot_bgcolor="white",
+                paper_bgcolor="white",
+                bargap=0,
+            )
+            fig.update_xaxes(dtick=1)
+            return fig
+
+        fig = cached_figure(data_version, 'Ratings', column_name, [formatted_form_name], build_fig)
 
         st.subheader(chart_title)
         st.markdown("  ")
@@ -88,23 +117,25 @@ def generate_rating_chart(column_name, chart_title, feedback_type=None, index=0)
                 with col1:
                     st.metric("Median", median_rating, delta_color='normal')
             with col2:
-                st.plotly_chart(fig, use_container_width=True)
+                plotly_chart(st, fig, f'Ratings: draw {column_name}', use_container_width=True, key=f"rating_chart_{column_name}")
             
-        if feedback_type in feedback_data and len(feedback_data[feedback_type]) > 0:
-            feedback_list = [feedback for feedback in feedback_data[feedback_type] if feedback.lower() != "n/a"]
-            if len(feedback_list) > 0:
-                c3, c4 = st.columns((7,3))
-                with c3:
-                    st.write("Attendee feedback")
-                with c4:
-                    guidelines_button = st.button("See all feedback", key=f"guidelines_button_{index}")
-                    if guidelines_button:
-                        switch_page("Feedback")
-                num_columns = min(3, len(feedback_list))
-                columns = st.columns(num_columns)
-                for i, feedback in enumerate(feedback_list[:num_columns]):
-                    with columns[i]:
-                        st.info(f"{feedback}")
+        summary = analytics.summary(formatted_form_name, feedback_type)
+        if summary is not None:
+            c3, c4 = st.columns((7,3))
+            with c3:
+                st.write("Attendee feedback")
+            with c4:
+                guidelines_button = st.button("See all feedback", key=f"guidelines_button_{index}")
+                if guidelines_button:
+                    st.switch_page("pages/Feedback.py")
+            st.write(f"{summary.comments} comments: {summary.positive / summary.comments:.0%} positive, {summary.neutral / summary.comments:.0%} neutral, {summary.negative / summary.comments:.0%} negative")
+            if len(summary.keywords) > 0:
+                st.write(f"Common themes: {', '.join(summary.keywords)}")
+            feedback_list = feedback_index.page(formatted_form_name, feedback_type, 0, 3)
+            columns = st.columns(len(feedback_list))
+            for i, feedback in enumerate(feedback_list):
+                with columns[i]:
+                    st.info(f"{feedback}")
 
 
         st.markdown("   ")
@@ -128,6 +159,33 @@ generate_rating_chart('Improvement Efforts', 'On a scale of 1 to 5, how satisfie
 # Sharing Interest Rating
 generate_rating_chart('Sharing Interest', 'On a scale of 1 to 5, how interested are you in sharing what you learned with others?', 6)
 
+# Ratings over time
+st.subheader("How do ratings change over time?")
+date_range = trends.date_range(formatted_form_name)
+if date_range is None:
+    st.write("No dated responses available.")
+else:
+    col1, col2 = st.columns(2)
+    trend_frequency = col1.radio("Group by", list(FREQUENCIES), index=2, horizontal=True)
+    picked_dates = col2.date_input("Dates", value=date_range, min_value=date_range[0], max_value=date_range[1])
+    start_date, end_date = picked_dates if len(picked_dates) == 2 else (picked_dates[0], date_range[1])
+
+    def build_trend_fig():
+        # Read from the pre-bucketed rollups, the whole range uses the stored periods
+        if (start_date, end_date) == date_range:
+            trend = trends.series(trend_frequency, formatted_form_name)
+        else:
+            trend = trends.series(trend_frequency, formatted_form_name, start_date, end_date)
+        rating_columns = ['Course Rating', 'Instructor Rating', 'Accessibility Rating', 'Navigation Rating', 'Improvement Efforts', 'Sharing Interest']
+        fig = px.line(trend, y=rating_columns, markers=True, height=400, labels=dict(Period='Date', value='Average Rating', variable='Rating'))
+        fig.update_traces(connectgaps=True)
+        fig.update_yaxes(range=[0, 5.2])
+        fig.update_layout(plot_bgcolor="white", paper_bgcolor="white")
+        return fig
+
+    fig = cached_figure(data_version, 'Ratings', 'ratings_trend', [formatted_form_name, trend_frequency, start_date, end_date], build_trend_fig)
+    plotly_chart(st, fig, 'Ratings: draw ratings_trend', use_container_width=True)
+
 # Add CSS to customize text colors
 st.markdown(f"""
     <style>
@@ -140,6 +198,10 @@ st.markdown(f"""
         h1, h2, h3, h4 {{
             color: {primary_color};
         }}
+        /* The diagnostics page is only reached by its URL, /perf */
+        [data-testid="stSidebarNav"] li:has(a[href$="/perf"]) {{
+            display: none;
+        }}
         button {{
             float: right;
         }}
@@ -157,3 +219,5 @@ hide_default_format = """
        </style>
        """
 st.markdown(hide_default_format, unsafe_allow_html=True)
+
+page_timer.stop()
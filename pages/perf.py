@@ -0,0 +1,96 @@
+import resource
+import pandas as pd
+import streamlit as st
+from data.figure_cache import FIGURES
+from data.handle import DATASET
+from data.timing import ENABLED, TIMINGS
+
+# Set page title and favicon
+st.set_page_config(page_title="Diagnostics", page_icon="assets/EENC-logo.png", layout="wide")
+
+# The process-wide dataset and the refresher keeping it current
+dataset = DATASET.current(st.session_state)
+refresher = DATASET.refresher
+
+# Set constants for theme colors
+primary_color = "#195E4C"
+secondary_color = "#3C9E8D"
+text_color = "#6D7183"
+
+st.title("Diagnostics")
+st.write("Latency of every stage of the page loads and data refreshes in this server process, cache hit rates and memory use.")
+st.markdown('---')
+
+# Stage latency
+st.header("Latency")
+if not ENABLED:
+    st.info("Timing is turned off. Start the server without EENC_TIMING=0 to record it.")
+else:
+    timings = TIMINGS.summary()
+    if len(timings) > 0:
+        st.dataframe(timings.style.format({"p50 (ms)": "{:.1f}", "p95 (ms)": "{:.1f}", "Max (ms)": "{:.1f}", "Last (ms)": "{:.1f}"}), hide_index=True, use_container_width=True)
+    else:
+        st.write("Nothing has been timed yet.")
+    if st.button("Reset timings"):
+        TIMINGS.clear()
+
+# Caches
+st.header("Caches")
+col1, col2, col3, col4 = st.columns(4)
+lookups = FIGURES.hits + FIGURES.misses
+col1.metric("Figure cache hit rate", f"{100 * FIGURES.hits / lookups:.1f}%" if lookups > 0 else "-")
+col2.metric("Cached figures", len(FIGURES.entries))
+col3.metric("Figure cache size", f"{FIGURES.size / 2**20:.1f} MB", help=f"Budget {FIGURES.max_bytes / 2**20:.0f} MB")
+col4.metric("Figure builds", FIGURES.misses)
+
+# Data refreshes
+st.header("Data Refreshes")
+if refresher is None:
+    st.write("Open the homepage first to start the data refresher.")
+else:
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Refreshes", refresher.refreshes)
+    col2.metric("Failed refreshes", refresher.failures)
+    col3.metric("Last refresh", "-" if refresher.last_duration is None else f"{refresher.last_duration:.2f} s")
+    col4.metric("Pushed changes", 0 if refresher.listeners is None else refresher.listeners.log.sequence)
+    st.caption(f"Data version {refresher.dataset.version}")
+    if refresher.last_error is not None:
+        st.warning(f"Last refresh failed: {refresher.last_error}")
+
+# Memory
+st.header("Memory")
+if dataset is None:
+    st.stop()
+data = dataset.master
+aggregates = dataset.aggregates
+feedback_data = dataset.feedback
+master_memory = data.memory_usage(deep=True)
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Master data", f"{master_memory.sum() / 2**20:.1f} MB", help=f"{len(data)} responses")
+col2.metric("Aggregates", f"{aggregates.cells.memory_usage(deep=True).sum() / 2**20:.2f} MB", help=f"{len(aggregates.cells)} cells")
+# Workers of a data host only hold the answered comments, in the shared search index
+if feedback_data is None:
+    col3.metric("Feedback comments", sum(len(segment.texts) for segment in dataset.search.segments.values()), help="Answered comments, shared with the data host")
+else:
+    col3.metric("Feedback comments", sum(len(values) for feedback in feedback_data.values() for values in feedback.values()))
+# Peak resident memory of the server process, reported in kilobytes on Linux
+col4.metric("Peak process memory", f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10:.0f} MB")
+
+st.subheader("Master data by column")
+st.dataframe(pd.DataFrame({"Column": master_memory.index, "dtype": [str(data.index.dtype)] + [str(dtype) for dtype in data.dtypes], "MB": master_memory.values / 2**20}).style.format({"MB": "{:.3f}"}), hide_index=True)
+
+# Add CSS to customize text colors
+st.markdown(f"""
+    <style>
+        p {{
+            color: {text_color};
+        }}
+        h1, h2, h3, h4, h5, h6 {{
+            color: {primary_color};
+        }}
+        /* The diagnostics page is only reached by its URL, /perf */
+        [data-testid="stSidebarNav"] li:has(a[href$="/perf"]) {{
+            display: none;
+        }}
+    </style>
+""", unsafe_allow_html=True)
@@ -0,0 +1,120 @@
+import datetime
+import threading
+from collections import namedtuple
+import pandas as pd
+from benchmarks.synthetic import Document, generate_responses, to_documents
+from data.aggregates import AggregateCube
+from data.listeners import FirestoreListeners
+from data.master_data import MasterDataLoader, documents_to_frame
+from data.refresher import DataRefresher
+
+# Replays a change stream through FirestoreListeners the way on_snapshot calls back,
+# so the delta path can be checked without Firestore or the emulator:
+#   python -m pytest tests
+
+ChangeType = namedtuple("ChangeType", ["name"])
+Change = namedtuple("Change", ["type", "document"])
+
+class ReplayedSource:
+    """
+    master_data and the form collections held in memory, read by
+    DataRefresher.refresh() the way FirestoreSource reads Firestore.
+    """
+
+    def __init__(self, documents):
+        self.collections = {"master_data": {document.id: document for document in documents}}
+        self.loader = MasterDataLoader(None)
+
+    def load_master(self, full=False):
+        return self.loader.merge(list(self.collections["master_data"].values()), full=True)
+
+    def load_feedback(self):
+        return {}
+
+    def replay(self, listeners, changes, collection="master_data"):
+        # Applies [(change type, document)] to the collection, then hands them to the listener
+        documents = self.collections.setdefault(collection, {})
+        for kind, document in changes:
+            if kind == "REMOVED":
+                documents.pop(document.id)
+            else:
+                documents[document.id] = document
+        changes = [Change(ChangeType(kind), document) for kind, document in changes]
+        listeners.callback(collection)(list(documents.values()), changes, datetime.datetime.now(datetime.timezone.utc))
+
+def start(size=500):
+    source = ReplayedSource(to_documents(generate_responses(size)))
+    refresher = DataRefresher(source)
+    refresher.refresh()
+    listeners = FirestoreListeners(None, refresher.apply_delta)
+    # The first snapshot of a subscription lists every document as added
+    source.replay(listeners, [("ADDED", document) for document in source.collections["master_data"].values()])
+    return source, refresher, listeners
+
+def changed(document, **fields):
+    return Document(document.id, dict(document.data, **fields))
+
+def new_documents(count, seed=1):
+    responses = generate_responses(count, seed=seed)
+    responses.index = [f"new{i}" for i in range(count)]
+    return to_documents(responses)
+
+def assert_rebuilt(source, dataset):
+    # The dataset after the deltas matches one built from scratch on the same documents
+    rebuilt = documents_to_frame(list(source.collections["master_data"].values()))
+    pd.testing.assert_frame_equal(dataset.master.sort_index(), rebuilt.sort_index(), check_categorical=False)
+    cube = AggregateCube(dataset.master)
+    assert set(cube.views) == set(dataset.aggregates.views)
+    for key, view in cube.views.items():
+        pd.testing.assert_series_equal(view.sort_index(), dataset.aggregates.views[key].sort_index(), check_names=False, rtol=1e-9)
+    for key, partition in dataset.partitions.partitions.items():
+        assert (partition["Form Name"] == key).all()
+    assert sum(len(partition) for partition in dataset.partitions.partitions.values()) == dataset.master["Form Name"].notna().sum()
+
+def test_sync_snapshot_keeps_the_dataset():
+    source, refresher, listeners = start()
+    assert refresher.dataset.master.attrs["version"] == source.loader.version
+    assert len(listeners.log.entries) == 1 and listeners.log.entries[0].sync
+
+def test_replayed_changes_match_a_rebuild():
+    source, refresher, listeners = start()
+    documents = list(source.collections["master_data"].values())
+    source.replay(listeners, [("ADDED", document) for document in new_documents(3)])
+    source.replay(listeners, [("MODIFIED", changed(documents[3], course_rating=1, form_name="online_pd"))])
+    source.replay(listeners, [("REMOVED", documents[7]), ("REMOVED", documents[8])])
+
+    dataset = refresher.dataset
+    assert "new0" in dataset.master.index and "row7" not in dataset.master.index
+    assert dataset.master.loc["row3", "Course Rating"] == 1
+    assert dataset.version == dataset.master.attrs["version"]
+    assert_rebuilt(source, dataset)
+    assert [delta.upserts for delta in listeners.log.since(1)][:2] == [["new0", "new1", "new2"], ["row3"]]
+
+def test_form_collection_changes_replace_its_feedback():
+    source, refresher, listeners = start()
+    source.replay(listeners, [("ADDED", Document("row0", {"general_feedback": "Great course"}))], collection="online_pd")
+    source.replay(listeners, [("ADDED", Document("row1", {"general_feedback": "Too long"}))], collection="online_pd")
+    assert refresher.dataset.feedback["online_pd"]["general_feedback"] == ["Great course", "Too long"]
+
+def test_deltas_and_refreshes_share_one_lock():
+    source, refresher, listeners = start()
+    lock = refresher.lock
+    errors = []
+
+    def refresh():
+        # refresh() reports its own failures, anything escaping it would end the background thread
+        try:
+            for _ in range(5):
+                refresher.refresh()
+        except Exception as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=refresh)
+    thread.start()
+    for document in new_documents(20, seed=2):
+        source.replay(listeners, [("ADDED", document)])
+    thread.join()
+
+    assert refresher.lock is lock
+    assert errors == [] and refresher.failures == 0
+    assert_rebuilt(source, refresher.dataset)